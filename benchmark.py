@@ -0,0 +1,195 @@
+import json
+import time
+import argparse
+from collections import defaultdict
+import numpy as np
+from collection_bm25 import build_bm25_index
+
+import hybrid
+from hybrid import EnhancedMedicalRetriever, COLLECTION_NAME, EMBEDDING_MODEL, TOP_K, FUSION_CANDIDATES
+
+TEST_DATA_PATH = "test_dataset_with_intents.json"
+RESULTS_PATH = "benchmark_results.json"
+INDEX_TYPES = ["qdrant", "faiss-flat", "faiss-hnsw"]
+STAGES = ["embedding", "intent_classification", "bm25", "search", "boosting", "total"]
+
+class StubLLM:
+    """Answers intent prompts with the labelled intents, so no generation runs during the benchmark"""
+
+    def __init__(self, intents_by_query):
+        self.intents_by_query = intents_by_query
+
+    def __call__(self, prompt, **kwargs):
+        query = prompt[len(hybrid.INTENT_PROMPT_PREFIX):].split("\n", 1)[0]
+        return ", ".join(self.intents_by_query.get(query, ["general.info"]))
+
+class FaissHit:
+    def __init__(self, score, payload):
+        self.score = score
+        self.payload = payload
+
+class FaissCollection:
+    """Just enough of QdrantClient.search over a FAISS inner-product index (vectors are unit length)"""
+
+    def __init__(self, vectors, payloads, index_type):
+        import faiss
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        faiss.normalize_L2(vectors)
+        if index_type == "faiss-hnsw":
+            self.index = faiss.IndexHNSWFlat(vectors.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+        else:
+            self.index = faiss.IndexFlatIP(vectors.shape[1])
+        self.index.add(vectors)
+        self.payloads = payloads
+
+    def search(self, collection_name, query_vector, limit, with_payload=True, score_threshold=None, search_params=None):
+        import faiss
+        query = np.asarray([query_vector], dtype=np.float32)
+        faiss.normalize_L2(query)
+        scores, ids = self.index.search(query, limit)
+        return [
+            FaissHit(float(score), self.payloads[idx])
+            for score, idx in zip(scores[0], ids[0])
+            if idx >= 0 and (score_threshold is None or score >= score_threshold)
+        ]
+
+def question_intents(example):
+    intents = example.get("intents", example.get("intent", []))
+    return [intents] if isinstance(intents, str) else list(intents)
+
+def load_corpus(test_data, corpus_path=None):
+    """Fixture corpus: every reference answer is the relevant document for its question, plus optional distractors"""
+    corpus = [
+        {"text": example["reference_answer"], "source": f"reference:{idx}",
+         "intents": question_intents(example), "relevant_for": [idx]}
+        for idx, example in enumerate(test_data)
+    ]
+    if corpus_path:
+        with open(corpus_path, encoding="utf-8") as f:
+            extra = json.load(f)
+        corpus.extend({"source": "fixture", "intents": [], "relevant_for": [], **doc} for doc in extra)
+    return corpus
+
+def build_retriever(corpus, test_data, index_type, embedder):
+    retriever = EnhancedMedicalRetriever()
+    retriever.embedder = embedder
+    retriever.llm = StubLLM({example["question"]: question_intents(example) for example in test_data})
+
+    texts = [doc["text"] for doc in corpus]
+    vectors = embedder.encode(texts, batch_size=64, convert_to_numpy=True)
+    payloads = [{"text": doc["text"], "source": doc["source"], "intents": doc["intents"]} for doc in corpus]
+
+    if index_type == "qdrant":
+        from qdrant_client import QdrantClient, models
+        retriever.qdrant = QdrantClient(":memory:")
+        retriever.qdrant.create_collection(
+            collection_name=COLLECTION_NAME,
+            vectors_config=models.VectorParams(size=vectors.shape[1], distance=models.Distance.COSINE)
+        )
+        for start in range(0, len(texts), 256):
+            retriever.qdrant.upsert(COLLECTION_NAME, points=[
+                models.PointStruct(id=i, vector=vectors[i].tolist(), payload=payloads[i])
+                for i in range(start, min(start + 256, len(texts)))
+            ])
+    else:
+        retriever.qdrant = FaissCollection(vectors, payloads, index_type)
+
+    # Same index the server builds from the collection's payloads
+    retriever.bm25, _ = build_bm25_index({"id": str(i), "text": doc["text"], "source": doc["source"],
+                                          "intents": doc["intents"], "duplicate_sources": []}
+                                         for i, doc in enumerate(corpus))
+    return retriever
+
+def percentiles(samples):
+    values = np.asarray(samples) * 1000
+    return {f"p{p}": round(float(np.percentile(values, p)), 3) for p in (50, 95, 99)} if len(values) else {}
+
+def run_benchmark(test_data, retriever, corpus, mode="dense", k=TOP_K, intent_boost=hybrid.INTENT_BOOST,
+                  score_threshold=hybrid.SCORE_THRESHOLD):
+    relevant = defaultdict(set)
+    for doc in corpus:
+        for idx in doc["relevant_for"]:
+            relevant[idx].add(doc["text"])
+
+    timings = defaultdict(list)
+    per_intent = defaultdict(lambda: {"recall": [], "rr": []})
+    for idx, example in enumerate(test_data):
+        query = example["question"]
+        start = time.perf_counter()
+
+        t = time.perf_counter()
+        query_vector = retriever.embed_query(query)
+        timings["embedding"].append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        query_intents = retriever.classify_intents(query)
+        timings["intent_classification"].append(time.perf_counter() - t)
+
+        bm25_hits = []
+        if mode == "hybrid":
+            t = time.perf_counter()
+            bm25_hits = retriever.bm25_search(query)
+            timings["bm25"].append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        hits = retriever.dense_search(query_vector, FUSION_CANDIDATES if mode == "hybrid" else k, score_threshold)
+        timings["search"].append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        candidates = hybrid.reciprocal_rank_fusion(hits, bm25_hits) if mode == "hybrid" else hybrid.dense_candidates(hits)
+        results = retriever.boost_by_intent(candidates, query_intents, k, intent_boost)
+        timings["boosting"].append(time.perf_counter() - t)
+        timings["total"].append(time.perf_counter() - start)
+
+        ranked = [result["text"] for result in results]
+        found = relevant[idx] & set(ranked)
+        recall = len(found) / len(relevant[idx]) if relevant[idx] else 0.0
+        rr = next((1 / rank for rank, text in enumerate(ranked, 1) if text in relevant[idx]), 0.0)
+        for intent in question_intents(example) or ["unlabeled"]:
+            for key in (intent, "all"):
+                per_intent[key]["recall"].append(recall)
+                per_intent[key]["rr"].append(rr)
+
+    # A multi-intent question counts towards each of its intents, and once towards "all"
+    quality = {
+        intent: {f"recall@{k}": round(float(np.mean(v["recall"])), 4), "mrr": round(float(np.mean(v["rr"])), 4),
+                 "questions": len(v["recall"])}
+        for intent, v in per_intent.items()
+    }
+    latency_ms = {stage: percentiles(timings[stage]) for stage in STAGES if timings[stage]}
+    return {"quality": quality, "latency_ms": latency_ms}
+
+if __name__ == "__main__":
+    from sentence_transformers import SentenceTransformer
+
+    parser = argparse.ArgumentParser(description="Offline retrieval benchmark: recall@k, MRR and per-stage latency")
+    parser.add_argument("--data", default=TEST_DATA_PATH)
+    parser.add_argument("--corpus", help="Extra fixture documents (JSON list of {text, source, intents})")
+    parser.add_argument("--index", choices=INDEX_TYPES, default="qdrant")
+    parser.add_argument("--mode", choices=["dense", "hybrid"], default="dense")
+    parser.add_argument("--k", type=int, default=TOP_K)
+    parser.add_argument("--intent-boost", type=float, default=hybrid.INTENT_BOOST)
+    parser.add_argument("--score-threshold", type=float, default=hybrid.SCORE_THRESHOLD)
+    parser.add_argument("--output", default=RESULTS_PATH)
+    args = parser.parse_args()
+
+    with open(args.data, encoding="utf-8") as f:
+        test_data = json.load(f)
+    corpus = load_corpus(test_data, args.corpus)
+    retriever = build_retriever(corpus, test_data, args.index, SentenceTransformer(EMBEDDING_MODEL))
+    report = run_benchmark(test_data, retriever, corpus, args.mode, args.k, args.intent_boost, args.score_threshold)
+    report["config"] = {
+        "index": args.index, "mode": args.mode, "k": args.k, "intent_boost": args.intent_boost,
+        "score_threshold": args.score_threshold, "questions": len(test_data), "corpus_size": len(corpus)
+    }
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'intent':<24}{'recall@' + str(args.k):>10}{'MRR':>8}")
+    for intent, scores in sorted(report["quality"].items()):
+        print(f"{intent:<24}{scores[f'recall@{args.k}']:>10.3f}{scores['mrr']:>8.3f}")
+    print()
+    for stage, values in report["latency_ms"].items():
+        print(f"{stage:<24}" + "  ".join(f"{p}={v:.2f}ms" for p, v in values.items()))
+    print(f"\nResults written to {args.output}")
@@ -0,0 +1,187 @@
+import os
+import json
+import mmap
+import numpy as np
+
+CHUNK_STORE_DIR = "chunk_store"
+
+# Columns are indexed directly by FAISS row ID; a length of -1 marks an unused or deleted ID
+COLUMNS = {
+    "offsets": np.int64,
+    "lengths": np.int32,
+    "sources": np.int32,
+    "pages": np.int32,
+    "intents": np.uint32,
+}
+
+class ChunkStore:
+    """Columnar, memory-mapped chunk metadata keyed by FAISS row ID"""
+
+    def __init__(self, path=CHUNK_STORE_DIR, writable=False):
+        self.path = path
+        self.writable = writable
+        with open(self._file("store.json"), encoding="utf-8") as f:
+            header = json.load(f)
+        self.labels = header["intents"]
+        self.source_names = header["sources"]
+        self._source_ids = {name: i for i, name in enumerate(self.source_names)}
+        self._size = header["size"]
+
+        # Readers map the columns straight from disk; writers keep a growable copy in memory
+        mode = None if writable else "r"
+        self._columns = {name: np.load(self._file(f"{name}.npy"), mmap_mode=mode) for name in COLUMNS}
+        self._blob = None
+        self._blob_size = os.path.getsize(self._file("texts.bin"))
+        if self._blob_size:
+            with open(self._file("texts.bin"), "rb") as f:
+                self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @classmethod
+    def create(cls, path=CHUNK_STORE_DIR, intents=()):
+        """Create an empty store, replacing any existing one at path"""
+        os.makedirs(path, exist_ok=True)
+        for name, dtype in COLUMNS.items():
+            np.save(os.path.join(path, f"{name}.npy"), np.empty(0, dtype=dtype))
+        open(os.path.join(path, "texts.bin"), "wb").close()
+        with open(os.path.join(path, "store.json"), "w", encoding="utf-8") as f:
+            json.dump({"intents": list(intents), "sources": [], "size": 0}, f)
+        return cls(path, writable=True)
+
+    @staticmethod
+    def exists(path=CHUNK_STORE_DIR):
+        return os.path.exists(os.path.join(path, "store.json"))
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def __len__(self):
+        return int(np.count_nonzero(self._columns["lengths"][:self._size] >= 0))
+
+    def __contains__(self, chunk_id):
+        return 0 <= chunk_id < self._size and self._columns["lengths"][chunk_id] >= 0
+
+    # --- Reads ---
+    def text(self, chunk_id):
+        if chunk_id not in self:
+            return None
+        start = int(self._columns["offsets"][chunk_id])
+        return self._read_blob(start, start + int(self._columns["lengths"][chunk_id])).decode("utf-8")
+
+    def intents(self, chunk_id):
+        """Intent labels of a chunk, or None if it has not been classified yet"""
+        if chunk_id not in self:
+            return None
+        return self.decode_intents(int(self._columns["intents"][chunk_id]))
+
+    def get(self, chunk_id):
+        if chunk_id not in self:
+            return None
+        source = int(self._columns["sources"][chunk_id])
+        page = int(self._columns["pages"][chunk_id])
+        return {
+            "id": chunk_id,
+            "text": self.text(chunk_id),
+            "source": self.source_names[source] if source >= 0 else None,
+            "page": page if page >= 0 else None,
+            "intents": self.intents(chunk_id),
+        }
+
+    def ids(self):
+        return np.flatnonzero(self._columns["lengths"][:self._size] >= 0)
+
+    def pending_ids(self):
+        """IDs of live chunks whose intents are still unclassified"""
+        live = self._columns["lengths"][:self._size] >= 0
+        return np.flatnonzero(live & (self._columns["intents"][:self._size] == 0))
+
+    def encode_intents(self, intents):
+        if intents is None:
+            return 0
+        return sum(1 << self.labels.index(label) for label in set(intents) if label in self.labels)
+
+    def decode_intents(self, mask):
+        if mask == 0:
+            return None
+        return [label for bit, label in enumerate(self.labels) if mask & (1 << bit)]
+
+    def _read_blob(self, start, end):
+        if self._blob is not None and end <= len(self._blob):
+            return self._blob[start:end]
+        # Text appended since the blob was mapped
+        with open(self._file("texts.bin"), "rb") as f:
+            f.seek(start)
+            return f.read(end - start)
+
+    # --- Writes ---
+    def _grow(self, size):
+        if size <= len(self._columns["lengths"]):
+            return
+        capacity = max(size, 2 * len(self._columns["lengths"]), 1024)
+        for name, column in self._columns.items():
+            grown = np.full(capacity, -1 if name != "intents" else 0, dtype=column.dtype)
+            grown[:len(column)] = column
+            self._columns[name] = grown
+
+    def _source_id(self, source):
+        if source is None:
+            return -1
+        if source not in self._source_ids:
+            self._source_ids[source] = len(self.source_names)
+            self.source_names.append(source)
+        return self._source_ids[source]
+
+    def put(self, chunk_ids, texts, sources, pages=None, intents=None):
+        """Write chunks under the given IDs; texts are appended to the blob"""
+        assert self.writable, "ChunkStore opened read-only"
+        if not chunk_ids:
+            return
+        pages = pages or [None] * len(chunk_ids)
+        intents = intents or [None] * len(chunk_ids)
+        self._grow(max(chunk_ids) + 1)
+        self._size = max(self._size, max(chunk_ids) + 1)
+
+        columns = self._columns
+        with open(self._file("texts.bin"), "ab") as blob:
+            for chunk_id, text, source, page, labels in zip(chunk_ids, texts, sources, pages, intents):
+                data = text.encode("utf-8")
+                blob.write(data)
+                columns["offsets"][chunk_id] = self._blob_size
+                columns["lengths"][chunk_id] = len(data)
+                columns["sources"][chunk_id] = self._source_id(source)
+                columns["pages"][chunk_id] = -1 if page is None else page
+                columns["intents"][chunk_id] = self.encode_intents(labels)
+                self._blob_size += len(data)
+
+    def set_intents(self, chunk_ids, intents):
+        assert self.writable, "ChunkStore opened read-only"
+        for chunk_id, labels in zip(chunk_ids, intents):
+            self._columns["intents"][chunk_id] = self.encode_intents(labels)
+
+    def set_sources(self, chunk_ids, sources, pages):
+        assert self.writable, "ChunkStore opened read-only"
+        for chunk_id, source, page in zip(chunk_ids, sources, pages):
+            self._columns["sources"][chunk_id] = self._source_id(source)
+            self._columns["pages"][chunk_id] = -1 if page is None else page
+
+    def delete(self, chunk_ids):
+        assert self.writable, "ChunkStore opened read-only"
+        for chunk_id in chunk_ids:
+            if chunk_id in self:
+                self._columns["lengths"][chunk_id] = -1
+
+    def flush(self):
+        """Persist columns and header; text is already on disk"""
+        assert self.writable, "ChunkStore opened read-only"
+        for name, column in self._columns.items():
+            tmp_path = self._file(f"{name}.tmp.npy")
+            np.save(tmp_path, column[:self._size])
+            os.replace(tmp_path, self._file(f"{name}.npy"))
+        tmp_path = self._file("store.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"intents": self.labels, "sources": self.source_names, "size": self._size}, f)
+        os.replace(tmp_path, self._file("store.json"))
+
+    def close(self):
+        if self._blob is not None:
+            self._blob.close()
+            self._blob = None
@@ -1,99 +1,516 @@
 import os
+import glob
 import json
+import time
+import hashlib
+import argparse
+from collections import deque
+from contextlib import nullcontext
+from itertools import islice, chain
+from concurrent.futures import ProcessPoolExecutor
 import faiss
 import numpy as np
-from transformers import pipeline, AutoModelForCausalLM, AutoTokenizer
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import DirectoryLoader
-from whoosh.index import create_in
+from langchain_community.document_loaders import DirectoryLoader, UnstructuredFileLoader
+from whoosh.index import create_in, open_dir, exists_in
 from whoosh.fields import Schema, TEXT, ID
 from whoosh.qparser import QueryParser
+from chunk_store import ChunkStore, CHUNK_STORE_DIR
+from embedding_cache import EmbeddingCache
+from dedup import NearDuplicateIndex, DEDUP_PATH
 
 # Paths
 INDEX_PATH = "faiss_index.bin"
-METADATA_PATH = "metadata.json"
 BM25_INDEX_DIR = "bm25_index"
+MANIFEST_PATH = "index_manifest.json"
+CHUNK_SIZE = 700
+CHUNK_OVERLAP = 70
+EMBED_BATCH_SIZE = 64
+CLASSIFY_BATCH_SIZE = 8
+CLASSIFY_WORKERS = 1
+CLASSIFY_MODES = ["inline", "deferred", "off"]
+CLASSIFY_MODE = "inline"
+LOAD_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+DEDUP = True  # drop exact and near-duplicate chunks (repeated disclaimers, headers, copied paragraphs)
+DEFAULT_DATA_DIR = r"C:\Users\merly\OneDrive\Desktop\ARO\healthcare\hi"
+
+EMBEDDING_MODEL = "NeuML/pubmedbert-base-embeddings"
+INTENT_MODEL = "microsoft/phi-2"
+
+# Models are loaded on first use so PDF-parsing worker processes never pay for them
+_embedding_model = None
+_embedding_cache = None
+_llm_pipeline = None
 
 # Load Embedding Model
-embedding_model = HuggingFaceEmbeddings(model_name="NeuML/pubmedbert-base-embeddings")
+def get_embedding_model():
+    global _embedding_model
+    if _embedding_model is None:
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+        _embedding_model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+    return _embedding_model
+
+def get_embedding_cache():
+    global _embedding_cache
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache(EMBEDDING_MODEL)
+    return _embedding_cache
 
 # Load Intent Classification Model
-model_name = "microsoft/phi-2"
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-tokenizer.pad_token = tokenizer.eos_token
-model = AutoModelForCausalLM.from_pretrained(model_name)
-llm_pipeline = pipeline("text-generation", model=model, tokenizer=tokenizer)
+def get_llm_pipeline():
+    global _llm_pipeline
+    if _llm_pipeline is None:
+        from transformers import pipeline, AutoModelForCausalLM, AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(INTENT_MODEL)
+        tokenizer.pad_token = tokenizer.eos_token
+        tokenizer.padding_side = "left"  # decoder-only models must be left-padded for batched generation
+        model = AutoModelForCausalLM.from_pretrained(INTENT_MODEL)
+        _llm_pipeline = pipeline("text-generation", model=model, tokenizer=tokenizer)
+    return _llm_pipeline
 
 VALID_INTENTS = ["disease_info", "treatment_info", "symptom_info", "cause_info", "general"]
 
 # Intent Classification
 def classify_text(text, text_type="query"):
-    prompt = f"Classify this medical {text_type} into multiple categories from: {VALID_INTENTS}. Return only valid labels. Text: {text}"
-    response = llm_pipeline(prompt, max_new_tokens=50, truncation=True, return_full_text=False)
-    categories = response[0]['generated_text'].strip().lower()
-    return [label for label in VALID_INTENTS if label in categories] or ["general"]
+    return classify_texts([text], text_type)[0]
+
+def classify_texts(texts, text_type="chunk", batch_size=CLASSIFY_BATCH_SIZE, intents=VALID_INTENTS):
+    # The last label of a taxonomy is its catch-all ("general" here, "general.info" in hybrid.py)
+    prompts = [
+        f"Classify this medical {text_type} into multiple categories from: {intents}. Return only valid labels. Text: {text}"
+        for text in texts
+    ]
+    responses = get_llm_pipeline()(prompts, batch_size=batch_size, max_new_tokens=50, truncation=True, return_full_text=False)
+    labels = []
+    for response in responses:
+        categories = response[0]['generated_text'].strip().lower()
+        labels.append([label for label in intents if label in categories] or [intents[-1]])
+    return labels
+
+def _init_classify_worker(num_threads):
+    # Keep workers from oversubscribing the CPU with torch's intra-op threads
+    import torch
+    torch.set_num_threads(num_threads)
+
+def classify_pool(workers=CLASSIFY_WORKERS):
+    if workers <= 1:
+        return nullcontext()
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_classify_worker, initargs=(threads,))
+
+def classify_parallel(texts, text_type="chunk", workers=CLASSIFY_WORKERS, batch_size=CLASSIFY_BATCH_SIZE, pool=None,
+                      intents=VALID_INTENTS):
+    if not texts:
+        return []
+    if workers <= 1:
+        return classify_texts(texts, text_type, batch_size, intents)
+    shard_size = -(-len(texts) // workers)
+    shards = [texts[i:i + shard_size] for i in range(0, len(texts), shard_size)]
+    with nullcontext(pool) if pool is not None else classify_pool(workers) as executor:
+        results = executor.map(classify_texts, shards, [text_type] * len(shards), [batch_size] * len(shards),
+                               [intents] * len(shards))
+        return [intents for shard in results for intents in shard]
 
 # Load & Chunk PDFs
 def load_and_chunk_documents(directory_path):
     if not os.path.exists(directory_path):
         print("⚠️ Directory not found:", directory_path)
         return []
-    loader = DirectoryLoader(directory_path, glob="**/*.pdf", show_progress=True)
+    loader = DirectoryLoader(directory_path, glob="**/*.pdf", show_progress=True, loader_cls=UnstructuredFileLoader,
+                             loader_kwargs={"mode": "paged"})
     documents = loader.load()
     if not documents:
         print("⚠️ No documents found in directory:", directory_path)
         return []
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=700, chunk_overlap=70)
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
     return text_splitter.split_documents(documents)
 
+def load_and_chunk_file(file_path):
+    # Paged mode gives one document per page with a page_number, which citations and duplicates rely on
+    documents = UnstructuredFileLoader(file_path, mode="paged").load()
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    return text_splitter.split_documents(documents)
+
+# Stream Chunks from PDFs Parsed in a Process Pool
+def iter_file_chunks(paths, workers=LOAD_WORKERS):
+    paths = iter(paths)
+    # Only a couple of files per worker are in flight, so memory stays bounded by the window, not the corpus
+    window = workers * 2
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque((path, pool.submit(load_and_chunk_file, path)) for path in islice(paths, window))
+        # Files come out in the order given, not as they finish, so deduplication keeps the same copy every run
+        while pending:
+            path, future = pending.popleft()
+            for next_path in islice(paths, 1):
+                pending.append((next_path, pool.submit(load_and_chunk_file, next_path)))
+            try:
+                chunks = future.result()
+            except Exception as e:
+                print(f"⚠️ Failed to load {path}: {e}")
+                continue
+            yield path, chunks
+
+def stream_chunks(directory_path, workers=LOAD_WORKERS):
+    if not os.path.exists(directory_path):
+        print("⚠️ Directory not found:", directory_path)
+        return
+    for _, chunks in iter_file_chunks(list_pdfs(directory_path), workers):
+        yield from chunks
+
+# Content Hashing
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def file_stat(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+def current_hashes(paths, files):
+    """Content hash of each file, reusing the manifest's hash for files whose size and mtime are unchanged"""
+    hashes, stats, rehashed = {}, {}, 0
+    for path in paths:
+        stats[path] = file_stat(path)
+        entry = files.get(path)
+        if entry is not None and entry.get("stat") == stats[path] and entry.get("hash"):
+            hashes[path] = entry["hash"]
+        else:
+            hashes[path] = file_hash(path)
+            rehashed += 1
+    return hashes, stats, rehashed
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def list_pdfs(directory_path):
+    pattern = os.path.join(directory_path, "**", "*.pdf")
+    return sorted(os.path.normpath(path) for path in glob.glob(pattern, recursive=True))
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return None
+    with open(MANIFEST_PATH, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("splitter") != [CHUNK_SIZE, CHUNK_OVERLAP]:
+        return None  # Chunk boundaries changed, every stored chunk hash is stale
+    return manifest
+
+def save_manifest(manifest):
+    manifest["splitter"] = [CHUNK_SIZE, CHUNK_OVERLAP]
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+# Batched Embedding, skipping texts already in the on-disk cache
+def embed_texts(texts, batch_size=EMBED_BATCH_SIZE):
+    return get_embedding_cache().embed(texts, lambda missing: _encode_texts(missing, batch_size))
+
+def _encode_texts(texts, batch_size):
+    vectors = None
+    for offset in range(0, len(texts), batch_size):
+        batch = get_embedding_model().embed_documents(texts[offset:offset + batch_size])
+        if vectors is None:
+            vectors = np.empty((len(texts), len(batch[0])), dtype=np.float32)
+        vectors[offset:offset + len(batch)] = batch
+    return vectors
+
+def _classify_for_index(texts, classify, workers, pool=None):
+    # Classify now, or leave intents unset for classify_metadata to fill in later
+    if classify == "inline":
+        return classify_parallel(texts, "chunk", workers, pool=pool)
+    return [None] * len(texts)
+
+def _chunk_page(chunk):
+    return chunk.metadata.get("page", chunk.metadata.get("page_number"))
+
+def _save_dedup_index(dedup_index):
+    if dedup_index is not None:
+        dedup_index.save(DEDUP_PATH)
+    elif os.path.exists(DEDUP_PATH):
+        os.remove(DEDUP_PATH)  # would miss the chunks indexed without it; the next deduplicated run rebuilds
+
+def _bm25_schema():
+    return Schema(id=ID(stored=True), source=ID(stored=True), content=TEXT(stored=True))
+
+def _report_throughput(action, count, start):
+    elapsed = time.perf_counter() - start
+    print(f"⏱️ {action} {count} chunks in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.1f} chunks/s)")
+
 # Index Chunks in FAISS & BM25
-def index_chunks(chunks):
-    if not chunks:
+def index_chunks(chunks, batch_size=EMBED_BATCH_SIZE, classify=CLASSIFY_MODE, workers=CLASSIFY_WORKERS, dedup=DEDUP):
+    numbered = enumerate(chunks)
+    first = list(islice(numbered, 1))
+    if not first:
         print("⚠️ No chunks to index.")
         return
 
-    vectors = []
-    metadata = {}
+    start = time.perf_counter()
+    index = None
+    indexed = 0
+    store = ChunkStore.create(CHUNK_STORE_DIR, VALID_INTENTS)
+    manifest = {"next_id": 0, "files": {}, "duplicates": {}}
+    dedup_index = NearDuplicateIndex() if dedup else None
 
     # Initialize BM25 Index
     if not os.path.exists(BM25_INDEX_DIR):
         os.mkdir(BM25_INDEX_DIR)
-    schema = Schema(id=ID(stored=True), content=TEXT(stored=True))
-    ix = create_in(BM25_INDEX_DIR, schema)
+    ix = create_in(BM25_INDEX_DIR, _bm25_schema())
     writer = ix.writer()
 
-    for i, chunk in enumerate(chunks):
-        text = chunk.page_content.strip()
-        if not text:
-            continue  # Skip empty chunks
+    # Chunks may be a generator: each batch is embedded and indexed as soon as it is complete
+    numbered = chain(first, numbered)
+    with classify_pool(workers if classify == "inline" else 1) as pool:
+        while batch := list(islice(numbered, batch_size)):
+            ids, texts, sources, pages = [], [], [], []
+            for i, chunk in batch:
+                manifest["next_id"] = i + 1
+                text = chunk.page_content.strip()
+                if not text:
+                    continue  # Skip empty chunks
 
-        # Generate embedding & classify
-        chunk_vector = embedding_model.embed_query(text)
-        vectors.append(chunk_vector)
-        intents = classify_text(text, "chunk")
+                source = os.path.normpath(chunk.metadata.get("source", ""))
+                kept = dedup_index.check(i, text) if dedup_index is not None else None
+                if kept is not None:
+                    # The file still lists the chunk, under the ID of the copy that was kept
+                    manifest["files"].setdefault(source, {"chunks": []})["chunks"].append([kept, text_hash(text)])
+                    manifest["duplicates"].setdefault(str(kept), []).append([source, _chunk_page(chunk)])
+                    continue
 
-        # Store metadata
-        metadata[text] = intents
+                ids.append(i)
+                texts.append(text)
+                sources.append(source)
+                pages.append(_chunk_page(chunk))
+                manifest["files"].setdefault(source, {"chunks": []})["chunks"].append([i, text_hash(text)])
 
-        # Add chunk to BM25 index
-        writer.add_document(id=str(i), content=text)
+                # Add chunk to BM25 index
+                writer.add_document(id=str(i), source=source, content=text)
+
+            if not texts:
+                continue
+
+            # Add to FAISS index, keyed by chunk ID so incremental runs can remove vectors
+            vectors_np = embed_texts(texts, batch_size)
+            if index is None:
+                index = faiss.IndexIDMap2(faiss.IndexFlatL2(vectors_np.shape[1]))
+            index.add_with_ids(vectors_np, np.array(ids, dtype=np.int64))
+            indexed += len(texts)
+
+            store.put(ids, texts, sources, pages, _classify_for_index(texts, classify, workers, pool))
 
     # Commit BM25 index
     writer.commit()
 
+    if index is None:
+        print("⚠️ All chunks were empty, nothing to embed.")
+        return
+
     # Store FAISS index
-    vectors_np = np.array(vectors, dtype=np.float32)
-    index = faiss.IndexFlatL2(vectors_np.shape[1])
-    index.add(vectors_np)
     faiss.write_index(index, INDEX_PATH)
 
-    # Save metadata
-    with open(METADATA_PATH, "w", encoding="utf-8") as f:
-        json.dump(metadata, f, ensure_ascii=False, indent=2)
+    # Save chunk metadata
+    store.flush()
+    store.close()
+
+    # Save manifest and the signatures incremental runs deduplicate new chunks against
+    for source, entry in manifest["files"].items():
+        entry["hash"] = file_hash(source) if os.path.exists(source) else None
+        entry["stat"] = file_stat(source) if os.path.exists(source) else None
+    save_manifest(manifest)
+    _save_dedup_index(dedup_index)
 
+    _report_throughput("Indexed", indexed, start)
+    if dedup_index is not None:
+        dedup_index.report()
     print("✔️ FAISS & BM25 indexes created successfully!")
 
+    if classify == "deferred":
+        classify_metadata(workers)
+
+# Incrementally Update FAISS & BM25 from a Directory
+def update_index(directory_path, batch_size=EMBED_BATCH_SIZE, classify=CLASSIFY_MODE, workers=CLASSIFY_WORKERS,
+                 load_workers=LOAD_WORKERS, dedup=DEDUP):
+    if not os.path.exists(directory_path):
+        print("⚠️ Directory not found:", directory_path)
+        return
+
+    manifest = load_manifest()
+    index = faiss.read_index(INDEX_PATH) if os.path.exists(INDEX_PATH) else None
+    bm25_ready = exists_in(BM25_INDEX_DIR) and "source" in open_dir(BM25_INDEX_DIR).schema.names()
+    dedup_index = NearDuplicateIndex.load(DEDUP_PATH) if dedup and os.path.exists(DEDUP_PATH) else None
+    if manifest is None or not isinstance(index, faiss.IndexIDMap2) or not bm25_ready or not ChunkStore.exists() \
+            or (dedup and dedup_index is None):
+        print("ℹ️ No usable manifest or ID-mapped index found, rebuilding from scratch.")
+        index_chunks(stream_chunks(directory_path, load_workers), batch_size, classify, workers, dedup)
+        return
+
+    start = time.perf_counter()
+    files = manifest["files"]
+    # Only files whose size or mtime changed are read; hashing the whole corpus would dominate every run
+    current, stats, rehashed = current_hashes(list_pdfs(directory_path), files)
+    duplicates = manifest.setdefault("duplicates", {})
+    store = ChunkStore(CHUNK_STORE_DIR, writable=True)
+    released = []  # IDs a removed or edited file no longer lists; deleted unless another file still does
+    new_ids, new_texts, new_sources, new_pages = [], [], [], []
+
+    removed_files = [path for path in files if path not in current]
+    for source in removed_files:
+        released.extend(chunk_id for chunk_id, _ in files.pop(source)["chunks"])
+
+    changed = [path for path, digest in current.items() if files.get(path, {}).get("hash") != digest]
+    for path in current.keys() - set(changed):
+        files[path]["stat"] = stats[path]  # touched but identical, so the next run skips hashing it
+    # Duplicate records of removed and changed files are rebuilt from what the files hold now
+    touched = set(removed_files) | set(changed)
+    for kept, copies in list(duplicates.items()):
+        copies = [copy for copy in copies if copy[0] not in touched]
+        if copies:
+            duplicates[kept] = copies
+        else:
+            del duplicates[kept]
+
+    for path, chunks in iter_file_chunks(changed, load_workers):
+        # Chunks whose text survived the edit keep their ID, vector and BM25 document
+        reusable = {}
+        for chunk_id, chunk_digest in files.get(path, {}).get("chunks", []):
+            reusable.setdefault(chunk_digest, []).append(chunk_id)
+
+        # Old chunks this file drops stay in the dedup index until the end of the run; an edited chunk must
+        # not match the version it replaces, or the edit would be dropped as a near-duplicate of itself
+        kept_digests = {text_hash(chunk.page_content.strip()) for chunk in chunks}
+        own_ids = {chunk_id for chunk_digest, ids in reusable.items() if chunk_digest not in kept_digests
+                   for chunk_id in ids if store.get(chunk_id)["source"] == path}
+
+        entry = {"hash": current[path], "stat": stats[path], "chunks": []}
+        listed_here = set()
+        for chunk in chunks:
+            text = chunk.page_content.strip()
+            if not text:
+                continue
+            chunk_digest = text_hash(text)
+            if reusable.get(chunk_digest):
+                chunk_id = reusable[chunk_digest].pop()
+                duplicate = chunk_id in listed_here or store.get(chunk_id)["source"] != path
+            else:
+                kept = dedup_index.check(manifest["next_id"], text, own_ids) if dedup_index is not None else None
+                duplicate = kept is not None
+                if duplicate:
+                    chunk_id = kept
+                else:
+                    chunk_id = manifest["next_id"]
+                    manifest["next_id"] += 1
+                    new_ids.append(chunk_id)
+                    new_texts.append(text)
+                    new_sources.append(path)
+                    new_pages.append(_chunk_page(chunk))
+            if duplicate:
+                duplicates.setdefault(str(chunk_id), []).append([path, _chunk_page(chunk)])
+            entry["chunks"].append([chunk_id, chunk_digest])
+            listed_here.add(chunk_id)
+        released.extend(chunk_id for stale in reusable.values() for chunk_id in stale)
+        files[path] = entry
+
+    listed = {chunk_id for entry in files.values() for chunk_id, _ in entry["chunks"]}
+    removed_ids = sorted({chunk_id for chunk_id in released if chunk_id not in listed})
+    # A kept chunk dropped by its own file lives on through a duplicate, which becomes its source
+    rehomed = []
+    for chunk_id in sorted({chunk_id for chunk_id in released if chunk_id in listed}):
+        owner = store.get(chunk_id)["source"]
+        copies = duplicates.get(str(chunk_id))
+        if not copies or chunk_id in {listed_id for listed_id, _ in files.get(owner, {}).get("chunks", [])}:
+            continue
+        source, page = copies.pop(0)
+        if not copies:
+            del duplicates[str(chunk_id)]
+        rehomed.append((chunk_id, source, page))
+
+    if not removed_ids and not new_ids and not rehomed:
+        print(f"✔️ Index is up to date ({rehashed} of {len(current)} files rehashed).")
+        store.close()
+        save_manifest(manifest)
+        return
+
+    # Update FAISS index in place
+    if removed_ids:
+        index.remove_ids(np.array(removed_ids, dtype=np.int64))
+    if new_texts:
+        index.add_with_ids(embed_texts(new_texts, batch_size), np.array(new_ids, dtype=np.int64))
+    faiss.write_index(index, INDEX_PATH)
+
+    # Update BM25 index through its writer
+    writer = open_dir(BM25_INDEX_DIR).writer()
+    for chunk_id in removed_ids:
+        writer.delete_by_term("id", str(chunk_id))
+    for chunk_id, source, _ in rehomed:
+        writer.delete_by_term("id", str(chunk_id))
+        writer.add_document(id=str(chunk_id), source=source, content=store.text(chunk_id))
+    for chunk_id, source, text in zip(new_ids, new_sources, new_texts):
+        writer.add_document(id=str(chunk_id), source=source, content=text)
+    writer.commit()
+
+    # Update chunk metadata
+    store.delete(removed_ids)
+    if rehomed:
+        store.set_sources(*zip(*rehomed))
+    store.put(new_ids, new_texts, new_sources, new_pages, _classify_for_index(new_texts, classify, workers))
+    store.flush()
+    store.close()
+
+    for chunk_id in removed_ids:
+        duplicates.pop(str(chunk_id), None)
+    save_manifest(manifest)
+    if dedup_index is not None:
+        dedup_index.remove(removed_ids)
+    _save_dedup_index(dedup_index)
+
+    elapsed = time.perf_counter() - start
+    print(f"✔️ Index updated in {elapsed:.1f}s: {len(new_ids)} chunks added, {len(removed_ids)} removed, "
+          f"{len(rehomed)} moved to a duplicate's file.")
+    if dedup_index is not None:
+        dedup_index.report("Deduplicated new")
+
+    if classify == "deferred":
+        classify_metadata(workers)
+
+# Classify chunks that were indexed with classification deferred or off
+def classify_metadata(workers=CLASSIFY_WORKERS):
+    if not ChunkStore.exists():
+        print("⚠️ Chunk store not found:", CHUNK_STORE_DIR)
+        return
+    store = ChunkStore(CHUNK_STORE_DIR, writable=True)
+
+    pending = store.pending_ids().tolist()
+    if not pending:
+        print("✔️ All chunks are already classified.")
+        store.close()
+        return
+    start = time.perf_counter()
+    store.set_intents(pending, classify_parallel([store.text(chunk_id) for chunk_id in pending], "chunk", workers))
+    _report_throughput("Classified", len(pending), start)
+
+    store.flush()
+    store.close()
+    print(f"✔️ Classified {len(pending)} pending chunks.")
+
 if __name__ == "__main__":
-    medical_chunks = load_and_chunk_documents(r"C:\Users\merly\OneDrive\Desktop\ARO\healthcare\hi")
-    index_chunks(medical_chunks)
+    parser = argparse.ArgumentParser(description="Build FAISS & BM25 indexes from a directory of medical PDFs")
+    parser.add_argument("directory", nargs="?", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="Chunks per embedding batch")
+    parser.add_argument("--classify", choices=CLASSIFY_MODES, default=CLASSIFY_MODE,
+                        help="Classify chunks before indexing, after indexing, or not at all")
+    parser.add_argument("--workers", type=int, default=CLASSIFY_WORKERS, help="Processes used for intent classification")
+    parser.add_argument("--load-workers", type=int, default=LOAD_WORKERS, help="Processes used for PDF parsing")
+    parser.add_argument("--classify-only", action="store_true", help="Only classify chunks left pending by an earlier run")
+    parser.add_argument("--incremental", action="store_true", help="Only process new, changed and deleted PDFs")
+    parser.add_argument("--no-dedup", action="store_true", help="Index exact and near-duplicate chunks too")
+    args = parser.parse_args()
+
+    if args.classify_only:
+        classify_metadata(args.workers)
+    elif args.incremental:
+        update_index(args.directory, args.batch_size, args.classify, args.workers, args.load_workers,
+                     not args.no_dedup)
+    else:
+        index_chunks(stream_chunks(args.directory, args.load_workers), args.batch_size, args.classify, args.workers,
+                     not args.no_dedup)
@@ -0,0 +1,42 @@
+from whoosh.filedb.filestore import RamStorage
+from whoosh.fields import Schema, TEXT, ID, STORED
+
+SCROLL_BATCH_SIZE = 1024  # points read per scroll request
+
+def bm25_schema():
+    return Schema(id=ID(stored=True, unique=True), source=ID(stored=True), content=TEXT(stored=True),
+                  intents=STORED, duplicate_sources=STORED)
+
+def collection_documents(client, collection, batch_size=SCROLL_BATCH_SIZE):
+    """Chunk payloads of every point in a Qdrant collection, without vectors"""
+    offset = None
+    while True:
+        points, offset = client.scroll(collection_name=collection, limit=batch_size, offset=offset,
+                                       with_payload=["text", "source", "intents", "duplicate_sources"],
+                                       with_vectors=False)
+        for point in points:
+            yield {
+                "id": str(point.id),
+                "text": point.payload.get("text", ""),
+                "source": point.payload.get("source") or "",
+                "intents": point.payload.get("intents") or [],
+                "duplicate_sources": point.payload.get("duplicate_sources") or [],
+            }
+        if offset is None:
+            return
+
+def build_bm25_index(documents):
+    """In-memory BM25 index over the same chunks as the dense collection, with their intents for boosting
+
+    Built from the collection rather than by each ingestion path, so keyword search always covers exactly
+    the points dense search can return: uploads and Qdrant-only corpora included, deleted chunks excluded.
+    """
+    index = RamStorage().create_index(bm25_schema())
+    writer = index.writer()
+    count = 0
+    for doc in documents:
+        writer.add_document(id=doc["id"], source=doc["source"], content=doc["text"], intents=doc["intents"],
+                            duplicate_sources=doc["duplicate_sources"])
+        count += 1
+    writer.commit()
+    return index, count
@@ -0,0 +1,40 @@
+import uuid
+
+VERSION_SUFFIX = "_version"  # companion collection holding the content version of a Qdrant collection
+MARKER_ID = 0
+
+def version_collection(collection):
+    return f"{collection}{VERSION_SUFFIX}"
+
+def bump_version(client, collection):
+    """Record that points of the collection were added, changed or removed; returns the new version
+
+    Every ingestion path calls this once its writes are done. Readers such as the answer cache compare
+    versions for equality, so a random token is enough and concurrent writers cannot lose a bump.
+    """
+    from qdrant_client import models
+    name = version_collection(collection)
+    if not client.collection_exists(name):
+        try:
+            client.create_collection(
+                collection_name=name,
+                vectors_config=models.VectorParams(size=1, distance=models.Distance.DOT)
+            )
+        except Exception:
+            if not client.collection_exists(name):  # otherwise another writer created it first
+                raise
+    version = uuid.uuid4().hex
+    client.upsert(
+        collection_name=name,
+        points=[models.PointStruct(id=MARKER_ID, vector=[1.0], payload={"version": version})],
+        wait=True
+    )
+    return version
+
+def read_version(client, collection):
+    """The collection's current version, or None if nothing was ever ingested through a versioned path"""
+    name = version_collection(collection)
+    if not client.collection_exists(name):
+        return None
+    points = client.retrieve(name, ids=[MARKER_ID], with_payload=True, with_vectors=False)
+    return points[0].payload.get("version") if points else None
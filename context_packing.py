@@ -0,0 +1,60 @@
+import re
+
+MIN_OVERLAP_CHARS = 20  # shorter shared boundaries are treated as coincidence
+MAX_OVERLAP_CHARS = 400
+NEAR_DUPLICATE_JACCARD = 0.8
+SHINGLE_SIZE = 3
+
+def _shingles(text):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def _boundary_overlap(left, right):
+    """Length of the longest suffix of left that is also a prefix of right"""
+    longest = min(len(left), len(right), MAX_OVERLAP_CHARS)
+    for size in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+def trim_overlap(text, packed_texts):
+    """Drop the spans of text that repeat the start or end of an already packed chunk"""
+    for other in packed_texts:
+        head = _boundary_overlap(other, text)
+        if head:
+            text = text[head:].lstrip()
+        tail = _boundary_overlap(text, other)
+        if tail:
+            text = text[:-tail].rstrip()
+    return text
+
+def pack_context(chunks, count_tokens, budget, line_format="{index}. {text}"):
+    """Greedily fill a token budget with the highest-scoring chunks, minus overlapping or near-duplicate text
+
+    Returns copies of the chunks that fit, best first, with "text" trimmed and "tokens" set.
+    """
+    packed = []
+    packed_shingles = []
+    used = 0
+    for chunk in sorted(chunks, key=lambda c: c.get("score", 0), reverse=True):
+        text = trim_overlap(chunk["text"].strip(), [p["text"] for p in packed])
+        if not text:
+            continue
+        shingles = _shingles(text)
+        if any(_jaccard(shingles, seen) >= NEAR_DUPLICATE_JACCARD for seen in packed_shingles):
+            continue
+
+        tokens = count_tokens(line_format.format(index=len(packed) + 1, text=text) + "\n")
+        if used + tokens > budget:
+            continue  # a shorter, lower-ranked chunk may still fit
+        packed.append({**chunk, "text": text, "tokens": tokens})
+        packed_shingles.append(shingles)
+        used += tokens
+    return packed
@@ -0,0 +1,170 @@
+import re
+import os
+import hashlib
+from collections import Counter
+import numpy as np
+
+DEDUP_PATH = "dedup_index.npz"
+DEDUP_THRESHOLD = 0.85  # estimated Jaccard similarity of word shingles for two chunks to count as one
+NUM_PERM = 128
+LSH_BANDS = 16  # 16 bands of 8 rows: chunks at 0.85 similarity share a band with ~99% probability
+SHINGLE_SIZE = 3
+SEED = 1
+
+_WORD = re.compile(r"\w+")
+_NUMBER = re.compile(r"\b\d+(?:[.,]\d+)*\b")
+
+def _hash64(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+def exact_key(text):
+    # Whitespace and case differences from PDF extraction still count as the same text
+    return _hash64(" ".join(text.lower().split()).encode("utf-8"))
+
+def numbers_key(text):
+    """Hash of the numbers in a chunk, in order; near-duplicates must agree on every dose and value"""
+    return _hash64(" ".join(_NUMBER.findall(text)).encode("utf-8"))
+
+def shingle_hashes(text, size=SHINGLE_SIZE):
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        shingles = [" ".join(words)]
+    else:
+        shingles = {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+    return np.array([_hash64(s.encode("utf-8")) & 0xFFFFFFFF for s in shingles], dtype=np.uint64)
+
+class NearDuplicateIndex:
+    """MinHash signatures in LSH band buckets, so each chunk is compared with a handful of candidates
+
+    Checking a chunk costs one signature and a dictionary lookup per band, which keeps deduplicating a corpus
+    linear in its size. Exact repeats are caught first by a hash of the normalized text. Near-duplicates are
+    candidates from a shared band whose signatures agree on at least `threshold` of their slots and whose
+    numbers are identical, so "5 mg" and "50 mg" versions of a paragraph are both kept.
+    """
+
+    def __init__(self, threshold=DEDUP_THRESHOLD, num_perm=NUM_PERM, bands=LSH_BANDS, seed=SEED):
+        assert num_perm % bands == 0, "num_perm must be a multiple of bands"
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.seed = seed
+        # Multiply-shift hashing: the high 32 bits of a*x + b (mod 2^64) for random odd a
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 2 ** 63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+        self.signatures = {}  # chunk ID -> signature
+        self._numbers = {}  # chunk ID -> numbers_key
+        self._exact = {}  # exact_key -> chunk ID
+        self._exact_keys = {}  # chunk ID -> exact_key
+        self._buckets = [{} for _ in range(bands)]
+        self.stats = Counter()
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def signature(self, text):
+        hashes = shingle_hashes(text)
+        with np.errstate(over="ignore"):
+            permuted = (hashes[:, None] * self._a + self._b) >> np.uint64(32)
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature):
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def find(self, text, exclude=()):
+        """(ID of a kept chunk this text duplicates or None, "exact"/"near"/None, state to pass to add)
+
+        Chunks in `exclude` are never matched, e.g. the previous chunks of a file that is being re-indexed.
+        """
+        key = exact_key(text)
+        if key in self._exact and self._exact[key] not in exclude:
+            return self._exact[key], "exact", None
+        signature, numbers = self.signature(text), numbers_key(text)
+        candidates = set()
+        for buckets, band_key in zip(self._buckets, self._band_keys(signature)):
+            candidates.update(buckets.get(band_key, ()))
+        best, best_similarity = None, self.threshold
+        for chunk_id in candidates:
+            if chunk_id in exclude or self._numbers[chunk_id] != numbers:
+                continue
+            similarity = float(np.mean(self.signatures[chunk_id] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = chunk_id, similarity
+        if best is not None:
+            return best, "near", None
+        return None, None, (key, signature, numbers)
+
+    def add(self, chunk_id, text, state=None):
+        key, signature, numbers = state or (exact_key(text), self.signature(text), numbers_key(text))
+        self._insert(chunk_id, key, signature, numbers)
+        self._exact[key] = chunk_id  # replaces an excluded chunk with the same text, which is on its way out
+
+    def _insert(self, chunk_id, key, signature, numbers):
+        self.signatures[chunk_id] = signature
+        self._numbers[chunk_id] = numbers
+        self._exact.setdefault(key, chunk_id)
+        self._exact_keys[chunk_id] = key
+        for buckets, band_key in zip(self._buckets, self._band_keys(signature)):
+            buckets.setdefault(band_key, []).append(chunk_id)
+
+    def check(self, chunk_id, text, exclude=()):
+        """Index the chunk and return None if it is new, or return the ID of the kept chunk it duplicates"""
+        self.stats["seen"] += 1
+        kept, kind, state = self.find(text, exclude)
+        if kept is None:
+            self.add(chunk_id, text, state)
+            self.stats["kept"] += 1
+        else:
+            self.stats[kind] += 1
+        return kept
+
+    def remove(self, chunk_ids):
+        for chunk_id in chunk_ids:
+            signature = self.signatures.pop(chunk_id, None)
+            if signature is None:
+                continue
+            del self._numbers[chunk_id]
+            key = self._exact_keys.pop(chunk_id)
+            if self._exact.get(key) == chunk_id:
+                del self._exact[key]
+            for buckets, band_key in zip(self._buckets, self._band_keys(signature)):
+                bucket = buckets[band_key]
+                bucket.remove(chunk_id)
+                if not bucket:
+                    del buckets[band_key]
+
+    def report(self, label="Deduplicated"):
+        seen, kept = self.stats["seen"], self.stats["kept"]
+        if not seen:
+            return
+        dropped = seen - kept
+        print(f"✂️ {label} {seen} chunks: {kept} kept, {dropped} dropped ({self.stats['exact']} exact, "
+              f"{self.stats['near']} near-duplicate), index {dropped / seen:.1%} smaller.")
+
+    def save(self, path=DEDUP_PATH):
+        ids = np.array(sorted(self.signatures), dtype=np.int64)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            ids=ids,
+            signatures=np.stack([self.signatures[i] for i in ids]) if len(ids) else
+            np.empty((0, self.num_perm), dtype=np.uint32),
+            numbers=np.array([self._numbers[i] for i in ids], dtype=np.uint64),
+            exact=np.array([self._exact_keys[i] for i in ids], dtype=np.uint64),
+            params=np.array([self.threshold, self.num_perm, self.bands, self.seed]),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=DEDUP_PATH):
+        """The saved index, or None if it was built with other parameters than the current ones"""
+        with np.load(path) as data:
+            threshold, num_perm, bands, seed = data["params"].tolist()
+            if (threshold, int(num_perm), int(bands), int(seed)) != (DEDUP_THRESHOLD, NUM_PERM, LSH_BANDS, SEED):
+                return None
+            index = cls()
+            for chunk_id, signature, numbers, key in zip(data["ids"].tolist(), data["signatures"],
+                                                         data["numbers"].tolist(), data["exact"].tolist()):
+                index._insert(chunk_id, key, signature, numbers)
+        return index
@@ -0,0 +1,188 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+EMBEDDING_CACHE_DIR = "embedding_cache"
+KEY_BYTES = 16  # truncated SHA-256 of the text; collisions are negligible at corpus scale
+MEMORY_CACHE_SIZE = 4096  # vectors kept in RAM only, for caches that do not persist new texts
+
+def text_key(text):
+    return hashlib.sha256(text.encode("utf-8")).digest()[:KEY_BYTES]
+
+class EmbeddingCache:
+    """Content-addressed embeddings for one model: an append-only float32 matrix plus one text key per row
+
+    Safe to share between processes: appends hold an exclusive lock on the directory's lock file and place
+    rows by the size of the files on disk, and lookups first read keys that other processes appended.
+    With persist=False new texts are only kept in a bounded in-memory LRU, which suits open-ended input
+    such as user queries; vectors already on disk are still read from there.
+    """
+
+    def __init__(self, model_name, path=EMBEDDING_CACHE_DIR, persist=True, memory_size=MEMORY_CACHE_SIZE):
+        self.model_name = model_name
+        # One directory per model, so vectors from different models never mix
+        self.path = os.path.join(path, hashlib.sha256(model_name.encode("utf-8")).hexdigest()[:16])
+        os.makedirs(self.path, exist_ok=True)
+        self.persist = persist
+        self.memory_size = memory_size
+        self.dimension = None
+        self._rows = {}
+        self._matrix = None
+        self._memory = OrderedDict()  # key -> vector, for texts not written to disk
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        with self._file_lock(shared=True):
+            self._refresh()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    @contextmanager
+    def _file_lock(self, shared=False):
+        # Threads are serialized by self._lock; this lock is between processes
+        with open(self._file("lock"), "a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue  # LK_LOCK gives up after ten seconds
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _disk_rows(self):
+        """Complete rows on disk: a key is only written after its vector, so a missing key hides a partial row"""
+        if self.dimension is None:
+            return 0
+        keys = os.path.getsize(self._file("keys.bin")) // KEY_BYTES
+        return min(keys, os.path.getsize(self._file("vectors.f32")) // (self.dimension * 4))
+
+    def _refresh(self):
+        """Pick up rows appended by other processes; call with the file lock held"""
+        if self.dimension is None:
+            if not os.path.exists(self._file("meta.json")):
+                return
+            with open(self._file("meta.json"), encoding="utf-8") as f:
+                self.dimension = json.load(f)["dimension"]
+        known, rows = len(self._rows), self._disk_rows()
+        if rows <= known:
+            return
+        with open(self._file("keys.bin"), "rb") as f:
+            f.seek(known * KEY_BYTES)
+            keys = f.read((rows - known) * KEY_BYTES)
+        for i in range(rows - known):
+            self._rows[keys[i * KEY_BYTES:(i + 1) * KEY_BYTES]] = known + i
+        self._matrix = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r",
+                                 shape=(rows, self.dimension))
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _append(self, keys, vectors):
+        with self._file_lock():
+            if self.dimension is None and not os.path.exists(self._file("meta.json")):
+                # meta.json last: readers take its presence to mean the data files exist
+                open(self._file("keys.bin"), "ab").close()
+                open(self._file("vectors.f32"), "ab").close()
+                with open(self._file("meta.json"), "w", encoding="utf-8") as f:
+                    json.dump({"model": self.model_name, "dimension": vectors.shape[1]}, f)
+            self._refresh()
+            fresh = [i for i, key in enumerate(keys) if key not in self._rows]  # another writer may have won
+            if not fresh:
+                return
+            # Nobody else is writing, so a partial row or key can only be left from a crash; drop it first
+            rows = self._disk_rows()
+            for name, size in (("keys.bin", rows * KEY_BYTES), ("vectors.f32", rows * self.dimension * 4)):
+                if os.path.getsize(self._file(name)) != size:
+                    with open(self._file(name), "r+b") as f:
+                        f.truncate(size)
+            # Vectors first: a key is only ever written after the row it points to
+            with open(self._file("vectors.f32"), "ab") as f:
+                np.ascontiguousarray(vectors[fresh], dtype=np.float32).tofile(f)
+            with open(self._file("keys.bin"), "ab") as f:
+                f.write(b"".join(keys[i] for i in fresh))
+            self._refresh()
+
+    def _remember(self, keys, vectors):
+        for key, vector in zip(keys, vectors):
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, key):
+        if key in self._rows:
+            return self._matrix[self._rows[key]]
+        vector = self._memory.get(key)
+        if vector is not None:
+            self._memory.move_to_end(key)
+        return vector
+
+    def embed(self, texts, encode):
+        """Vectors for texts as a float32 array; only texts never seen before are passed to encode"""
+        if not texts:
+            return np.empty((0, self.dimension or 0), dtype=np.float32)
+        keys = [text_key(text) for text in texts]
+        with self._lock:
+            if any(key not in self._rows and key not in self._memory for key in keys):
+                with self._file_lock(shared=True):
+                    self._refresh()
+            missing = {}
+            held = {}  # in-memory hits, taken now since another thread may evict them before we return
+            for i, key in enumerate(keys):
+                if key in self._rows:
+                    continue
+                if key in self._memory:
+                    held[key] = self._lookup(key)
+                else:
+                    missing.setdefault(key, i)
+            misses = sum(key in missing for key in keys)
+            self.hits += len(keys) - misses
+            self.misses += misses
+
+        if missing:
+            vectors = np.asarray(encode([texts[i] for i in missing.values()]), dtype=np.float32)
+            encoded = dict(zip(missing, vectors.reshape(len(missing), -1)))
+            held.update(encoded)
+            with self._lock:
+                if self.persist:
+                    self._append(list(encoded), np.stack(list(encoded.values())))
+                else:
+                    self._remember(encoded.keys(), encoded.values())
+
+        with self._lock:
+            return np.stack([np.asarray(held[key] if key in held else self._lookup(key), dtype=np.float32)
+                             for key in keys])
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "model": self.model_name,
+                "entries": len(self._rows),
+                "memory_entries": len(self._memory),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
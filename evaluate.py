@@ -1,3 +1,8 @@
+import os
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 from qdrant_client import QdrantClient, models
@@ -8,15 +13,23 @@ from langchain_community.llms import LlamaCpp
 import json
 from sklearn.metrics.pairwise import cosine_similarity
 import bert_score
+from prompt_cache import PrefixCachedLlama
+from llm_pool import LLMPool
+from embedding_cache import EmbeddingCache
 
 # Configuration
 QDRANT_URL = "http://localhost:6333"
 COLLECTION_NAME = "try_db"
 EMBEDDING_MODEL = "NeuML/pubmedbert-base-embeddings"
+SIMILARITY_MODEL = "all-MiniLM-L6-v2"
 LLM_MODEL_PATH = "ggml-model-Q4_K_M.gguf"
 INTENT_BOOST = 0.15
+QUANTIZATION_OVERSAMPLING = 2.0
 TEST_DATA_PATH = "test_dataset_with_intents.json"
 BERTSCORE_MODEL = "bert-base-uncased"
+CHECKPOINT_PATH = "evaluation_checkpoint.jsonl"
+LLM_WORKERS = 0  # LlamaCpp replicas in worker processes; 0 evaluates sequentially with one in-process model
+LLM_READY_TIMEOUT = 600
 
 MEDICAL_INTENTS = [
     "treatment.drug", "treatment.surgery",
@@ -40,17 +53,28 @@ EXAMPLES:
 - "MRI protocol for stroke" → diagnosis.tests
 - "What is SMA?" → general.info"""
 
+# Static part of the intent prompt; its llama.cpp state is saved once and restored for every query
+INTENT_PROMPT_PREFIX = f"""Classify the query into 1-2 medical intents using these rules:
+
+{INTENT_RULES}
+
+Query: """
+
 class EnhancedMedicalRetriever:
-    def __init__(self):
+    def __init__(self, llm_workers: int = LLM_WORKERS):
         self.embedder = SentenceTransformer(EMBEDDING_MODEL)
+        self.embedding_cache = EmbeddingCache(EMBEDDING_MODEL)
         self.qdrant = QdrantClient(QDRANT_URL)
-        self.llm = LlamaCpp(
-            model_path=LLM_MODEL_PATH, 
-            temperature=0.3, 
-            max_tokens=2048, 
-            n_ctx=2048,
-            verbose=False
-        )
+        llm_kwargs = dict(model_path=LLM_MODEL_PATH, temperature=0.3, max_tokens=2048, n_ctx=2048, verbose=False)
+        if llm_workers > 0:
+            # One evaluation thread per replica keeps every worker busy without ever filling the queue
+            self.llm = LLMPool(llm_workers, llm_workers, prefixes=[INTENT_PROMPT_PREFIX], **llm_kwargs)
+            if not self.llm.wait_ready(LLM_READY_TIMEOUT):
+                self.llm.close()
+                raise RuntimeError(f"LLM workers did not load the model within {LLM_READY_TIMEOUT}s")
+        else:
+            self.llm = PrefixCachedLlama(LlamaCpp(**llm_kwargs), [INTENT_PROMPT_PREFIX])
+        self.llm_workers = llm_workers
         
         # Create collection if not exists
         existing_collections = [c.name for c in self.qdrant.get_collections().collections]
@@ -66,11 +90,7 @@ class EnhancedMedicalRetriever:
     def classify_intents(self, query: str) -> List[str]:
         """Use local LLM to classify medical intent"""
         try:
-            prompt = f"""Classify the query into 1-2 medical intents using these rules:
-
-{INTENT_RULES}
-
-Query: {query}
+            prompt = f"""{INTENT_PROMPT_PREFIX}{query}
 
 Detected Intents (choose from: {', '.join(MEDICAL_INTENTS)}):"""
             response = self.llm(prompt)
@@ -82,7 +102,7 @@ Detected Intents (choose from: {', '.join(MEDICAL_INTENTS)}):"""
 
     def retrieve_context(self, query: str) -> List[Dict]:
         """Retrieve context and boost scores by intent relevance"""
-        query_vector = self.embedder.encode(query).tolist()
+        query_vector = self.embedding_cache.embed([query], self.embedder.encode)[0].tolist()
         query_intents = self.classify_intents(query)
 
         results = self.qdrant.search(
@@ -90,7 +110,10 @@ Detected Intents (choose from: {', '.join(MEDICAL_INTENTS)}):"""
             query_vector=query_vector,
             limit=5,
             with_payload=True,
-            score_threshold=0.4
+            score_threshold=0.4,
+            search_params=models.SearchParams(
+                quantization=models.QuantizationSearchParams(rescore=True, oversampling=QUANTIZATION_OVERSAMPLING)
+            )
         )
 
         boosted_results = []
@@ -153,14 +176,38 @@ Respond ONLY with 'Yes' or 'No':
     except:
         return 0.0
 
-# Initialize similarity model once
-similarity_model = SentenceTransformer('all-MiniLM-L6-v2')
+# Initialize similarity model once, on first use (LLM worker processes re-import this module)
+similarity_model = None
+similarity_caches = {}
+
+def get_similarity_model() -> SentenceTransformer:
+    global similarity_model
+    if similarity_model is None:
+        similarity_model = SentenceTransformer(SIMILARITY_MODEL)
+    return similarity_model
+
+def encode_for_similarity(texts: List[str], persist: bool = False) -> np.ndarray:
+    """Similarity-model embeddings; only reference answers are written to the on-disk cache
+
+    Generated answers differ on every run, so they are kept in memory only and the cache files stay bounded.
+    """
+    if persist not in similarity_caches:
+        similarity_caches[persist] = EmbeddingCache(SIMILARITY_MODEL, persist=persist)
+    return similarity_caches[persist].embed(texts,
+                                            lambda missing: get_similarity_model().encode(missing, batch_size=64))
 
 def calculate_similarity(generated: str, reference: str) -> float:
     """Calculate semantic similarity using local embeddings"""
-    emb1 = similarity_model.encode([generated])
-    emb2 = similarity_model.encode([reference])
-    return cosine_similarity(emb1, emb2)[0][0]
+    emb1 = encode_for_similarity([generated])[0]
+    emb2 = encode_for_similarity([reference], persist=True)[0]
+    return cosine_similarity([emb1], [emb2])[0][0]
+
+def calculate_similarity_batch(generateds: List[str], references: List[str]) -> np.ndarray:
+    """Pairwise semantic similarity from one batched encode of the generated and one of the reference answers"""
+    embeddings = np.concatenate([encode_for_similarity(generateds), encode_for_similarity(references, persist=True)])
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings = embeddings / np.where(norms == 0, 1, norms)
+    return np.sum(embeddings[:len(generateds)] * embeddings[len(generateds):], axis=1)
 
 def calculate_bertscore_batch(generateds: List[str], references: List[str]) -> dict:
     """Calculate BERTScore metrics for a batch of texts"""
@@ -178,66 +225,91 @@ def calculate_bertscore_batch(generateds: List[str], references: List[str]) -> d
         "f1": F1.numpy()
     }
 
-def evaluate_rag_system(test_data: List[dict], retriever: EnhancedMedicalRetriever):
-    """Full evaluation with BERTScore metrics"""
-    # Phase 1: Generate all answers
-    all_questions = []
-    all_generated = []
-    all_references = []
-    all_contexts = []
-    
+def load_checkpoint(path: str, test_data: List[dict]) -> Dict[int, dict]:
+    """Load finished questions from a previous run, ignoring any that no longer match the dataset"""
+    done = {}
+    if not path or not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut short by a crash
+            idx = record.get("index")
+            if isinstance(idx, int) and idx < len(test_data) and test_data[idx]["question"] == record["question"]:
+                done[idx] = record
+    return done
+
+def evaluate_question(idx: int, example: dict, retriever: EnhancedMedicalRetriever) -> dict:
+    """Generate and judge one answer"""
+    contexts = retriever.retrieve_context(example["question"])
+    answer = retriever.generate_answer(example["question"], contexts[:3])
+    context_texts = [c["text"] for c in contexts]
+    return {
+        "index": idx,
+        "question": example["question"],
+        "reference_answer": example["reference_answer"],
+        "generated_answer": answer,
+        "contexts": context_texts,
+        "faithfulness": calculate_faithfulness(answer, context_texts, retriever.llm)
+    }
+
+def evaluate_rag_system(test_data: List[dict], retriever: EnhancedMedicalRetriever, checkpoint_path: str = CHECKPOINT_PATH):
+    """Full evaluation with BERTScore metrics, resumable from a per-question checkpoint"""
+    # Phase 1: Generate and judge answers, in parallel across LLM workers
+    records = load_checkpoint(checkpoint_path, test_data)
+    if records:
+        print(f"Resuming: {len(records)}/{len(test_data)} questions already evaluated")
+    pending = [idx for idx in range(len(test_data)) if idx not in records]
+    checkpoint_lock = threading.Lock()
+
     print("Generating answers...")
-    for example in tqdm(test_data):
-        try:
-            contexts = retriever.retrieve_context(example["question"])
-            answer = retriever.generate_answer(example["question"], contexts[:3])
-            
-            all_questions.append(example["question"])
-            all_generated.append(answer)
-            all_references.append(example["reference_answer"])
-            all_contexts.append([c["text"] for c in contexts])
-        except Exception as e:
-            print(f"Error processing {example['question']}: {str(e)}")
-            # Maintain list alignment
-            all_questions.append(example["question"])
-            all_generated.append("")
-            all_references.append("")
-            all_contexts.append([])
-
-    # Phase 2: Calculate metrics
+    with ThreadPoolExecutor(max_workers=max(1, retriever.llm_workers)) as pool, \
+            open(checkpoint_path, "a", encoding="utf-8") if checkpoint_path else open(os.devnull, "w") as checkpoint:
+        futures = {pool.submit(evaluate_question, idx, test_data[idx], retriever): idx for idx in pending}
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            idx = futures[future]
+            try:
+                record = future.result()
+            except Exception as e:
+                print(f"Error processing {test_data[idx]['question']}: {str(e)}")
+                # Maintain list alignment; failed questions are retried on the next run
+                records[idx] = {
+                    "index": idx,
+                    "question": test_data[idx]["question"],
+                    "reference_answer": "",
+                    "generated_answer": "",
+                    "contexts": [],
+                    "faithfulness": 0.0
+                }
+                continue
+            records[idx] = record
+            with checkpoint_lock:
+                checkpoint.write(json.dumps(record) + "\n")
+                checkpoint.flush()
+
+    # Phase 2: Batch metrics over all answers
     print("Calculating metrics...")
-    results = []
-    
-    # Batch calculate BERTScore
+    ordered = [records[idx] for idx in range(len(test_data))]
+    all_generated = [r["generated_answer"] for r in ordered]
+    all_references = [r["reference_answer"] for r in ordered]
     bert_scores = calculate_bertscore_batch(all_generated, all_references)
-    
-    # Individual metrics
-    for idx in tqdm(range(len(all_questions))):
-        try:
-            faithfulness = calculate_faithfulness(
-                all_generated[idx],
-                all_contexts[idx],
-                retriever.llm
-            )
-            
-            similarity = calculate_similarity(
-                all_generated[idx],
-                all_references[idx]
-            )
-            
-            results.append({
-                "question": all_questions[idx],
-                "faithfulness": faithfulness,
-                "semantic_similarity": similarity,
-                "bertscore_precision": bert_scores["precision"][idx],
-                "bertscore_recall": bert_scores["recall"][idx],
-                "bertscore_f1": bert_scores["f1"][idx],
-                "generated_answer": all_generated[idx],
-                "reference_answer": all_references[idx]
-            })
-        except Exception as e:
-            print(f"Error processing metrics for {all_questions[idx]}: {str(e)}")
-    
+    similarities = calculate_similarity_batch(all_generated, all_references)
+
+    results = []
+    for idx, record in enumerate(ordered):
+        results.append({
+            "question": record["question"],
+            "faithfulness": record["faithfulness"],
+            "semantic_similarity": similarities[idx],
+            "bertscore_precision": bert_scores["precision"][idx],
+            "bertscore_recall": bert_scores["recall"][idx],
+            "bertscore_f1": bert_scores["f1"][idx],
+            "generated_answer": record["generated_answer"],
+            "reference_answer": record["reference_answer"]
+        })
+
     return pd.DataFrame(results)
 
 def format_response(results: List[Dict], query_intents: List[str]) -> str:
@@ -265,6 +337,12 @@ def chat_interface(query, history):
     return f"{answer}\n\n---\n\n{metadata}"
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate the RAG pipeline against the labelled test set")
+    parser.add_argument("--workers", type=int, default=LLM_WORKERS, help="LLM worker processes (0 = sequential)")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH, help="Per-question checkpoint file")
+    parser.add_argument("--fresh", action="store_true", help="Discard the checkpoint and evaluate every question")
+    args = parser.parse_args()
+
     # Load test data
     try:
         test_data = load_test_data(TEST_DATA_PATH)
@@ -274,10 +352,12 @@ if __name__ == "__main__":
         exit()
 
     # Initialize components
-    retriever = EnhancedMedicalRetriever()
+    retriever = EnhancedMedicalRetriever(args.workers)
+    if args.fresh and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
     
     # Run evaluation
-    df = evaluate_rag_system(test_data, retriever)
+    df = evaluate_rag_system(test_data, retriever, args.checkpoint)
     
     # Save and show results
     df.to_csv("evaluation_results.csv", index=False)
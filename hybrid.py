@@ -1,8 +1,23 @@
-from flask import Flask, request, jsonify
-from qdrant_client import QdrantClient, models
-from sentence_transformers import SentenceTransformer
-from langchain_community.llms import LlamaCpp
+import os
+import time
+import json
+import argparse
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
+from whoosh.query import Or, Term
+from semantic_cache import SemanticCache
+from llm_pool import LLMPool, PoolBusy
+from prompt_cache import PrefixCachedLlama
+from context_packing import pack_context
+from embedding_cache import EmbeddingCache
+from collection_version import read_version
+from collection_bm25 import build_bm25_index, collection_documents
+from intent_head import IntentHead, INTENT_HEAD_PATH
+from metrics import Metrics, NULL_TIMER, CONTENT_TYPE as METRICS_CONTENT_TYPE
 
 app = Flask(__name__)
 CORS(app)
@@ -12,7 +27,34 @@ QDRANT_URL = "http://localhost:6333"
 COLLECTION_NAME = "try_db"
 EMBEDDING_MODEL = "NeuML/pubmedbert-base-embeddings"
 LLM_MODEL_PATH = "ggml-model-Q4_K_M.gguf"  # <- Change this!
+LLM_N_CTX = 2048
+LLM_KWARGS = dict(model_path=LLM_MODEL_PATH, temperature=0.3, max_tokens=2048, top_p=1, n_ctx=LLM_N_CTX)
+ANSWER_TOKEN_RESERVE = 512  # context window kept free for the generated answer
+CONTEXT_TOKEN_BUDGET = None  # cap on retrieved-context tokens; None uses whatever the window leaves
+LLM_WORKERS = 0  # model replicas in worker processes; 0 keeps a single in-process model
+PRODUCTION_LLM_WORKERS = 1  # threaded servers need the pool's bounded queue, or requests pile up on llm_lock
+LLM_MAX_PENDING = 8  # requests queued behind busy workers before answering 503
+RETRY_AFTER = 5
+SERVER_THREADS = 16
+WARMUP_QUERY = "What are the side effects of metformin?"
+LLM_READY_TIMEOUT = 600
 INTENT_BOOST = 0.15
+SCORE_THRESHOLD = 0.4
+QUANTIZATION_OVERSAMPLING = 2.0  # int8 candidates fetched per result, rescored with the original vectors
+SEARCH_MODE = "hybrid"  # "hybrid" (BM25 + dense with rank fusion) or "dense"
+TOP_K = 5
+FUSION_CANDIDATES = 20  # hits taken from each retriever before fusion
+RRF_K = 60
+INTENT_DEADLINE = 1.0  # seconds after a request starts to wait for intents; None waits for the LLM
+INTENT_CACHE_SIZE = 1024
+INTENT_MAX_TOKENS = 24  # one or two labels; LLM_KWARGS' max_tokens is sized for answers
+INTENT_STOP = ["\n\n", "Query:"]
+INTENT_LLM_FALLBACK = True  # ask the LLM when the embedding intent head is unsure; False always trusts the head
+SEMANTIC_CACHE_THRESHOLD = 0.95  # cosine similarity for two queries to share an answer
+SEMANTIC_CACHE_SIZE = 1024
+SEMANTIC_CACHE_TTL = 3600
+CACHE_VERSION_INTERVAL = 30  # seconds between collection change checks
+METRICS_ENABLED = True  # per-stage timings in responses and histograms on /metrics
 
 MEDICAL_INTENTS = [
     "treatment.drug", "treatment.surgery",
@@ -36,64 +78,317 @@ EXAMPLES:
 - "MRI protocol for stroke" → diagnosis.tests
 - "What is SMA?" → general.info"""
 
+# Everything before the query is identical across calls, so its llama.cpp state is cached (see prompt_cache.py)
+INTENT_PROMPT_PREFIX = f"""Classify the query into 1-2 medical intents using these rules:
+
+{INTENT_RULES}
+
+Query: """
+
+def intent_prompt(query):
+    return f"""{INTENT_PROMPT_PREFIX}{query}
+
+Detected Intents (choose from: {', '.join(MEDICAL_INTENTS)}):"""
+
 class EnhancedMedicalRetriever:
-    def __init__(self):
+    def __init__(self, llm_workers=LLM_WORKERS, llm_max_pending=LLM_MAX_PENDING):
+        # Construction is cheap; models are loaded by load(), usually on a background thread
+        self.llm_workers = llm_workers
+        self.llm_max_pending = llm_max_pending
+        self.embedder = None
+        self.embedding_cache = None
+        self.intent_head = None
+        self.qdrant = None
+        self.llm = None
+        self.tokenizer = None
+        self.bm25 = None
+        self.bm25_version = None  # collection version the BM25 index was built from
+        self.search_params = None
+        self.ready = threading.Event()
+        self.load_error = None
+
+        self._bm25_local = threading.local()
+        self._bm25_rebuild = threading.Lock()
+        self.search_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="search")
+
+        # An in-process LlamaCpp is not thread-safe; pooled replicas do their own queueing
+        self.llm_lock = nullcontext() if llm_workers > 0 else threading.Lock()
+        self.intent_pool = ThreadPoolExecutor(max_workers=max(1, llm_workers), thread_name_prefix="intent")
+        self._intent_cache = OrderedDict()
+        self._intent_cache_lock = threading.Lock()
+
+    def _load_embedder(self):
+        from sentence_transformers import SentenceTransformer
         self.embedder = SentenceTransformer(EMBEDDING_MODEL)
+        # Shared with chunking.py and evaluate.py; user queries are kept in memory only, so the files stay bounded
+        self.embedding_cache = EmbeddingCache(EMBEDDING_MODEL, persist=False)
+        # Trained by `python intent_head.py train`; without it every uncached query goes to the LLM
+        if os.path.exists(INTENT_HEAD_PATH):
+            self.intent_head = IntentHead.load(INTENT_HEAD_PATH)
+
+    def _load_llm(self):
+        if self.llm_workers > 0:
+            # Generation runs in worker processes; embedding and Qdrant stay in the request threads
+            self.llm = LLMPool(self.llm_workers, self.llm_max_pending, prefixes=[INTENT_PROMPT_PREFIX], **LLM_KWARGS)
+            if not self.llm.wait_ready(LLM_READY_TIMEOUT):
+                raise RuntimeError("LLM workers did not start in time")
+            # The model lives in the workers; a vocab-only copy is enough to count prompt tokens here
+            from llama_cpp import Llama
+            self.tokenizer = Llama(model_path=LLM_MODEL_PATH, vocab_only=True, verbose=False)
+        else:
+            from langchain_community.llms import LlamaCpp
+            self.llm = PrefixCachedLlama(LlamaCpp(**LLM_KWARGS), [INTENT_PROMPT_PREFIX])
+            self.tokenizer = self.llm.client
+
+    def count_tokens(self, text):
+        return len(self.tokenizer.tokenize(text.encode("utf-8"), add_bos=False))
+
+    def _connect_qdrant(self):
+        from qdrant_client import QdrantClient, models
         self.qdrant = QdrantClient(QDRANT_URL)
-        self.llm = LlamaCpp(model_path=LLM_MODEL_PATH, temperature=0.3, max_tokens=2048, top_p=1, n_ctx=2048)
+        # Ignored by collections without quantization (see qdrant_ingest.py --quantize)
+        self.search_params = models.SearchParams(
+            quantization=models.QuantizationSearchParams(rescore=True, oversampling=QUANTIZATION_OVERSAMPLING)
+        )
+        self.ensure_payload_index()
 
+    def ensure_payload_index(self):
+        from qdrant_client import models
+        payload_schema = self.qdrant.get_collection(COLLECTION_NAME).payload_schema or {}
+        if "intents" in payload_schema:
+            return
         self.qdrant.create_payload_index(
             collection_name=COLLECTION_NAME,
             field_name="intents",
             field_schema=models.PayloadSchemaType.KEYWORD
         )
 
-    def classify_intents(self, query):
+    def load(self, warm_up=True):
+        start = time.perf_counter()
         try:
-            prompt = f"""Classify the query into 1-2 medical intents using these rules:
+            # The embedder, the LLM and Qdrant are independent, so they load side by side
+            with ThreadPoolExecutor(max_workers=3, thread_name_prefix="load") as loader:
+                for future in [loader.submit(self._load_embedder), loader.submit(self._load_llm),
+                               loader.submit(self._connect_qdrant)]:
+                    future.result()
 
-{INTENT_RULES}
+            # Keyword search covers the same points as dense search: the BM25 index is built from the collection
+            self.build_bm25()
 
-Query: {query}
+            if warm_up:
+                self.warm_up()
+        except Exception as e:
+            self.load_error = str(e)
+            print(f"Retriever failed to load: {e}")
+            return
+        print(f"Retriever ready in {time.perf_counter() - start:.1f}s")
+        self.ready.set()
 
-Detected Intents (choose from: {', '.join(MEDICAL_INTENTS)}):"""
-            response = self.llm(prompt)
+    def build_bm25(self):
+        # Version first: a change made while the index builds is picked up by the next refresh
+        version = read_version(self.qdrant, COLLECTION_NAME)
+        start = time.perf_counter()
+        bm25, count = build_bm25_index(collection_documents(self.qdrant, COLLECTION_NAME))
+        self.bm25, self.bm25_version = bm25, version
+        print(f"BM25 index of {count} chunks built in {time.perf_counter() - start:.1f}s")
+
+    def refresh_bm25(self, version):
+        """Rebuild the BM25 index in the background when the collection changed; searches use the old one meanwhile"""
+        if version == self.bm25_version or not self._bm25_rebuild.acquire(blocking=False):
+            return
+
+        def rebuild():
+            try:
+                self.build_bm25()
+            except Exception as e:
+                print(f"BM25 rebuild error: {e}")
+                metrics.count_error("bm25_rebuild")
+            finally:
+                self._bm25_rebuild.release()
+
+        threading.Thread(target=rebuild, daemon=True, name="bm25-rebuild").start()
+
+    def warm_up(self):
+        # One full retrieval primes the embedder, Qdrant connection, BM25 searcher and LLM before real traffic
+        self.retrieve_context(WARMUP_QUERY, intent_deadline=None)
+
+    @property
+    def llm_pool(self):
+        return self.llm if isinstance(self.llm, LLMPool) else None
+
+    def llm_saturated(self):
+        return self.llm_pool is not None and self.llm_pool.is_full()
+
+    def cached_intents(self, query):
+        key = query.strip().lower()
+        with self._intent_cache_lock:
+            intents = self._intent_cache.get(key)
+            if intents is not None:
+                self._intent_cache.move_to_end(key)
+            return intents
+
+    def _cache_intents(self, query, intents):
+        key = query.strip().lower()
+        with self._intent_cache_lock:
+            self._intent_cache[key] = intents
+            self._intent_cache.move_to_end(key)
+            while len(self._intent_cache) > INTENT_CACHE_SIZE:
+                self._intent_cache.popitem(last=False)
+
+    def intent_llm_kwargs(self, cancel=None):
+        kwargs = {"max_tokens": INTENT_MAX_TOKENS, "stop": INTENT_STOP}
+        if cancel is not None and self.llm_pool is None:
+            # Checked after every generated token, so a request that gave up on intents frees the model at once
+            from llama_cpp import StoppingCriteriaList
+            kwargs["stopping_criteria"] = StoppingCriteriaList([lambda input_ids, logits: cancel.is_set()])
+        return kwargs
+
+    def classify_intents(self, query, timer=NULL_TIMER, cancel=None):
+        """Intents for the query; setting `cancel` stops an in-process classification, which then returns []"""
+        cached = self.cached_intents(query)
+        if cached is not None:
+            return cached
+        try:
+            prompt = intent_prompt(query)
+            with timer.stage("intent_classification"):
+                with self.llm_lock:
+                    if cancel is not None and cancel.is_set():
+                        return []  # the request stopped waiting before the model was free
+                    start = time.perf_counter()
+                    response = self.llm(prompt, **self.intent_llm_kwargs(cancel))
+                    elapsed = time.perf_counter() - start
+            if cancel is not None and cancel.is_set() and self.llm_pool is None:
+                return []  # cut short, so not worth caching
+            if timer.enabled:
+                timer.record_tokens("intent", self.count_tokens(prompt), self.count_tokens(response), elapsed)
             generated = response.lower().strip()
-            return list(set(intent for intent in MEDICAL_INTENTS if intent in generated)) or ["general.info"]
+            intents = list(set(intent for intent in MEDICAL_INTENTS if intent in generated)) or ["general.info"]
         except Exception as e:
             print(f"Intent classification error: {e}")
+            metrics.count_error("intent_classification")
             return ["general.info"]
+        self._cache_intents(query, intents)
+        return intents
 
-    def retrieve_context(self, query):
-        query_vector = self.embedder.encode(query).tolist()
-        query_intents = self.classify_intents(query)
+    def bm25_search(self, query, limit=FUSION_CANDIDATES, timer=NULL_TIMER):
+        if self.bm25 is None:
+            return []
+        with timer.stage("bm25_search"):
+            return self._bm25_search(query, limit)
 
-        results = self.qdrant.search(
-            collection_name=COLLECTION_NAME,
-            query_vector=query_vector,
-            limit=5,
-            with_payload=True,
-            score_threshold=0.4
-        )
+    def _bm25_search(self, query, limit):
+        # Whoosh searchers are not thread-safe, so each search thread keeps its own and refreshes it;
+        # a rebuilt index replaces self.bm25, and with it every thread's searcher
+        bm25 = self.bm25
+        searcher = getattr(self._bm25_local, "searcher", None)
+        if getattr(self._bm25_local, "index", None) is not bm25:
+            searcher = None
+        searcher = searcher.refresh() if searcher else bm25.searcher()
+        self._bm25_local.index, self._bm25_local.searcher = bm25, searcher
+
+        # Build the query from analyzed terms so "?" or "*" in user text is never parsed as syntax
+        terms = {token.text for token in bm25.schema["content"].analyzer(query)}
+        if not terms:
+            return []
+        hits = searcher.search(Or([Term("content", term) for term in terms]), limit=limit)
+        return [{
+            "text": hit["content"],
+            "source": hit.get("source") or "Unknown",
+            "intents": hit.get("intents") or [],
+            "duplicate_sources": hit.get("duplicate_sources") or [],
+        } for hit in hits]
+
+    def dense_search(self, query_vector, limit=TOP_K, score_threshold=SCORE_THRESHOLD, timer=NULL_TIMER):
+        with timer.stage("dense_search"):
+            return self.qdrant.search(
+                collection_name=COLLECTION_NAME,
+                query_vector=query_vector,
+                limit=limit,
+                with_payload=True,
+                score_threshold=score_threshold,
+                search_params=self.search_params
+            )
+
+    def wait_for_intents(self, intents_future, deadline, cancel=None):
+        if deadline is None:
+            return intents_future.result()
+        try:
+            return intents_future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeout:
+            # Drop it if it never started, and stop it if it did: in-process, it would otherwise hold
+            # llm_lock ahead of this request's answer. Pooled replicas finish it into the cache for next time.
+            intents_future.cancel()
+            if cancel is not None:
+                cancel.set()
+            return []
+
+    def embed_query(self, query, timer=NULL_TIMER):
+        with timer.stage("embedding"):
+            if self.embedding_cache is None:
+                return self.embedder.encode(query).tolist()
+            return self.embedding_cache.embed([query], self.embedder.encode)[0].tolist()
+
+    def collection_version(self):
+        # Bumped by every ingestion path; point and segment counts miss edits and change when segments merge
+        return read_version(self.qdrant, COLLECTION_NAME)
+
+    def retrieve_context(self, query, mode=SEARCH_MODE, intent_deadline=INTENT_DEADLINE, query_vector=None,
+                         timer=NULL_TIMER):
+        deadline = time.monotonic() + intent_deadline if intent_deadline is not None else None
+        query_intents = self.cached_intents(query)
+        intents_future = None
+        cancel = threading.Event()
+        # With an intent head the LLM is only asked once the query vector shows the head is unsure
+        if query_intents is None and self.intent_head is None:
+            intents_future = self.intent_pool.submit(self.classify_intents, query, timer, cancel)
+
+        hybrid = mode == "hybrid" and self.bm25 is not None
+        if hybrid:
+            bm25_future = self.search_pool.submit(self.bm25_search, query, timer=timer)
+
+        if query_vector is None:
+            query_vector = self.embed_query(query, timer)
+        if query_intents is None and intents_future is None:
+            with timer.stage("intent_head"):
+                head_intents, confident = self.intent_head.predict(query_vector)
+            if confident or not INTENT_LLM_FALLBACK:
+                query_intents = head_intents
+                metrics.count_intents("head")
+            else:
+                intents_future = self.intent_pool.submit(self.classify_intents, query, timer, cancel)
+                metrics.count_intents("llm_fallback")
+        results = self.dense_search(query_vector, FUSION_CANDIDATES if hybrid else TOP_K, timer=timer)
+
+        # Without intents in time, results keep their unboosted order
+        if query_intents is None:
+            with timer.stage("intent_wait"):
+                query_intents = self.wait_for_intents(intents_future, deadline, cancel)
+
+        if not hybrid:
+            with timer.stage("boosting"):
+                return self.boost_by_intent(dense_candidates(results), query_intents), query_intents
 
+        bm25_hits = bm25_future.result()
+        with timer.stage("boosting"):
+            return self.boost_by_intent(reciprocal_rank_fusion(results, bm25_hits), query_intents), query_intents
+
+    def boost_by_intent(self, candidates, query_intents, top_k=TOP_K, intent_boost=INTENT_BOOST):
         boosted_results = []
-        for hit in results:
-            chunk_intents = hit.payload.get("intents", [])
-            intent_matches = len(set(query_intents) & set(chunk_intents))
-            boosted_score = hit.score * (1 + INTENT_BOOST) ** intent_matches
-
-            boosted_results.append({
-                "text": hit.payload["text"],
-                "score": round(boosted_score, 3),
+        for candidate in candidates:
+            intent_matches = len(set(query_intents) & set(candidate.pop("chunk_intents")))
+            boosted_score = candidate.pop("base_score") * (1 + intent_boost) ** intent_matches
+
+            boosted_results.append((boosted_score, {
+                "text": candidate["text"],
+                "score": round(boosted_score, 4),
                 "intent_matches": intent_matches,
-                "source": hit.payload.get("source", "Unknown"),
-                "original_score": round(hit.score, 3)
-            })
-        return sorted(boosted_results, key=lambda x: x["score"], reverse=True), query_intents
+                **{key: value for key, value in candidate.items() if key != "text"}
+            }))
+        boosted_results.sort(key=lambda x: x[0], reverse=True)
+        return [result for _, result in boosted_results[:top_k]]
 
-    def generate_answer(self, query, context_chunks):
-        context_text = "\n".join([f"{i+1}. {chunk['text']}" for i, chunk in enumerate(context_chunks)])
-        prompt = f"""You are a helpful medical assistant. Use the following context to answer the query.
+    def _answer_template(self, query, context_text):
+        return f"""You are a helpful medical assistant. Use the following context to answer the query.
 
 Context:
 {context_text}
@@ -101,10 +396,137 @@ Context:
 Query: {query}
 
 Answer:"""
-        response = self.llm(prompt)
+
+    def budget_context(self, query, context_chunks):
+        # Chunks share up to chunk_overlap characters, so repeated spans are trimmed before budgeting
+        available = LLM_N_CTX - ANSWER_TOKEN_RESERVE - self.count_tokens(self._answer_template(query, ""))
+        budget = min(available, CONTEXT_TOKEN_BUDGET) if CONTEXT_TOKEN_BUDGET else available
+        return pack_context(context_chunks, self.count_tokens, budget)
+
+    def answer_prompt(self, query, context_chunks, timer=NULL_TIMER):
+        with timer.stage("context_packing"):
+            packed = self.budget_context(query, context_chunks)
+        context_text = "\n".join([f"{i+1}. {chunk['text']}" for i, chunk in enumerate(packed)])
+        return self._answer_template(query, context_text)
+
+    def generate_answer(self, query, context_chunks, timer=NULL_TIMER):
+        prompt = self.answer_prompt(query, context_chunks, timer)
+        with timer.stage("generation"):
+            with self.llm_lock:
+                start = time.perf_counter()
+                response = self.llm(prompt)
+                elapsed = time.perf_counter() - start
+        if timer.enabled:
+            timer.record_tokens("answer", self.count_tokens(prompt), self.count_tokens(response), elapsed)
         return response.strip()
 
-retriever = EnhancedMedicalRetriever()
+    def stream_answer(self, query, context_chunks, timer=NULL_TIMER):
+        # The model stays locked until the stream is exhausted or closed by a disconnecting client
+        prompt = self.answer_prompt(query, context_chunks, timer)
+        pieces = []
+        with self.llm_lock:
+            start = time.perf_counter()
+            for piece in self.llm.stream(prompt):
+                if not pieces:
+                    timer.record_stage("first_token", time.perf_counter() - start)
+                pieces.append(piece)
+                yield piece
+            elapsed = time.perf_counter() - start
+        timer.record_stage("generation", elapsed)
+        if timer.enabled:
+            timer.record_tokens("answer", self.count_tokens(prompt), self.count_tokens("".join(pieces)), elapsed)
+
+def dense_candidates(hits):
+    return [{
+        "text": hit.payload["text"],
+        "base_score": hit.score,
+        "chunk_intents": hit.payload.get("intents", []),
+        "source": hit.payload.get("source", "Unknown"),
+        "duplicate_sources": hit.payload.get("duplicate_sources", []),
+        "original_score": round(hit.score, 3)
+    } for hit in hits]
+
+def reciprocal_rank_fusion(dense_hits, bm25_hits, k=RRF_K):
+    # Chunks are matched across retrievers by text, so a duplicated text is fused once
+    fused = {}
+    for rank, hit in enumerate(dense_hits, 1):
+        if hit.payload["text"] in fused:
+            continue  # keep the best-ranked copy of duplicated text
+        fused[hit.payload["text"]] = {
+            "text": hit.payload["text"],
+            "base_score": 1 / (k + rank),
+            "chunk_intents": hit.payload.get("intents", []),
+            "source": hit.payload.get("source", "Unknown"),
+            "duplicate_sources": hit.payload.get("duplicate_sources", []),
+            "original_score": round(hit.score, 3),
+            "retrievers": ["dense"]
+        }
+    for rank, hit in enumerate(bm25_hits, 1):
+        entry = fused.setdefault(hit["text"], {
+            "text": hit["text"],
+            "base_score": 0.0,
+            "chunk_intents": hit.get("intents", []),
+            "source": hit["source"],
+            "duplicate_sources": hit.get("duplicate_sources", []),
+            "original_score": None,
+            "retrievers": []
+        })
+        entry["base_score"] += 1 / (k + rank)
+        entry["retrievers"].append("bm25")
+    return list(fused.values())
+
+retriever = None
+answer_cache = SemanticCache(SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_TTL)
+metrics = Metrics(METRICS_ENABLED)
+_cache_checked_at = 0.0
+_retriever_lock = threading.Lock()
+
+def init_retriever(llm_workers=LLM_WORKERS, llm_max_pending=LLM_MAX_PENDING, background=True):
+    global retriever
+    retriever = EnhancedMedicalRetriever(llm_workers, llm_max_pending)
+    if background:
+        threading.Thread(target=retriever.load, daemon=True, name="retriever-load").start()
+    else:
+        retriever.load()
+    return retriever
+
+@app.before_request
+def ensure_retriever():
+    # Servers that import the app (gunicorn, waitress-serve, flask run) skip __main__, so start loading here
+    if retriever is None:
+        with _retriever_lock:
+            if retriever is None:
+                init_retriever(PRODUCTION_LLM_WORKERS)
+
+def not_ready_response():
+    status = "failed" if retriever is not None and retriever.load_error else "loading"
+    response = jsonify({"error": f"Service is {status}, please retry shortly", "status": status})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(RETRY_AFTER)
+    return response
+
+def is_ready():
+    return retriever is not None and retriever.ready.is_set()
+
+def busy_response():
+    response = jsonify({"error": "Server is busy, please retry shortly"})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(RETRY_AFTER)
+    return response
+
+def refresh_collection_caches():
+    # Cached answers and the BM25 index are only valid for the collection version they were built from
+    global _cache_checked_at
+    if time.monotonic() - _cache_checked_at < CACHE_VERSION_INTERVAL:
+        return
+    _cache_checked_at = time.monotonic()
+    try:
+        version = retriever.collection_version()
+        answer_cache.check_version(version)
+        retriever.refresh_bm25(version)
+    except Exception as e:
+        print(f"Cache version check error: {e}")
+        metrics.count_error("cache_version")
 
 def format_response(results, query_intents):
     response = [
@@ -114,35 +536,202 @@ def format_response(results, query_intents):
     ]
 
     for idx, res in enumerate(results, 1):
+        base = f"base: {res['original_score']}" if res["original_score"] is not None else "keyword match"
+        # Near-duplicate copies were dropped at ingestion; their files are still worth citing
+        also_in = f"   - Also in: {', '.join(res['duplicate_sources'])}\n" if res.get("duplicate_sources") else ""
         response.append(
             f"{idx}. {res['text']}\n"
             f"   - Source: {res['source']}\n"
+            f"{also_in}"
             f"   - Intent matches: {res['intent_matches']}\n"
-            f"   - Relevance score: {res['score']} (base: {res['original_score']})"
+            f"   - Relevance score: {res['score']} ({base})"
         )
     return "\n".join(response)
 
+def format_timings(timings):
+    if not timings:
+        return ""
+    lines = ["\n### Request Timings:"]
+    lines.extend(f"- {stage}: {ms} ms" for stage, ms in timings["stages_ms"].items())
+    for stage, counts in timings["tokens"].items():
+        lines.append(
+            f"- {stage} tokens: {counts['prompt_tokens']} prompt, {counts['completion_tokens']} generated "
+            f"({counts['tokens_per_second']} tokens/s)"
+        )
+    return "\n".join(lines)
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    # Liveness: the process is up and serving requests, even while models load
+    return jsonify({"status": "alive"})
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    if not is_ready():
+        return not_ready_response()
+    return jsonify({"status": "ready"})
+
 @app.route("/chat", methods=["POST"])
 def chat():
+    if not is_ready():
+        return not_ready_response()
     try:
         data = request.get_json()
         query = data.get("query")
         if not query:
             return jsonify({"error": "No query provided"}), 400
 
-        results, query_intents = retriever.retrieve_context(query)
-        answer = retriever.generate_answer(query, results)
+        timer = metrics.timer()
+        refresh_collection_caches()
+        query_vector = retriever.embed_query(query, timer)
+        with timer.stage("cache_lookup"):
+            cached = answer_cache.lookup(query_vector)
+        if cached is not None:
+            metrics.count_request("cached")
+            return jsonify(with_timings({**cached, "cached": True}, timer.finish()))
+
+        if retriever.llm_saturated():
+            metrics.count_request("busy")
+            return busy_response()
+
+        results, query_intents = retriever.retrieve_context(query, query_vector=query_vector, timer=timer)
+        answer = retriever.generate_answer(query, results, timer)
         metadata = format_response(results, query_intents)
 
-        return jsonify({
+        # Timings belong to this request only, so they stay out of the cached response
+        response = {
             "answer": answer,
             "query_intents": query_intents,
             "contexts": results,
             "response_metadata": metadata
-        })
+        }
+        answer_cache.put(query_vector, response)
+        metrics.count_request("answered")
+        return jsonify(with_timings({**response, "cached": False}, timer.finish()))
 
+    except PoolBusy:
+        metrics.count_request("busy")
+        return busy_response()
     except Exception as e:
+        print(f"Chat error: {e}")
+        metrics.count_request("error")
+        metrics.count_error("chat")
         return jsonify({"error": str(e)}), 500
 
+def with_timings(response, timings):
+    if timings is None:
+        return response
+    return {**response, "response_metadata": response["response_metadata"] + format_timings(timings), "timings": timings}
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    if not is_ready():
+        return not_ready_response()
+    data = request.get_json(silent=True) or {}
+    query = data.get("query")
+    if not query:
+        return jsonify({"error": "No query provided"}), 400
+    if retriever.llm_saturated():
+        metrics.count_request("busy")
+        return busy_response()
+
+    def events():
+        timer = metrics.timer()
+        try:
+            refresh_collection_caches()
+            query_vector = retriever.embed_query(query, timer)
+            with timer.stage("cache_lookup"):
+                cached = answer_cache.lookup(query_vector)
+            if cached is not None:
+                metrics.count_request("cached")
+                yield sse_event("context", {"query_intents": cached["query_intents"], "contexts": cached["contexts"], "cached": True})
+                yield sse_event("token", {"token": cached["answer"]})
+                done = with_timings(cached, timer.finish())
+                yield sse_event("done", {key: done[key] for key in ("answer", "response_metadata", "timings") if key in done})
+                return
+
+            results, query_intents = retriever.retrieve_context(query, query_vector=query_vector, timer=timer)
+            yield sse_event("context", {"query_intents": query_intents, "contexts": results, "cached": False})
+
+            tokens = []
+            for token in retriever.stream_answer(query, results, timer):
+                tokens.append(token)
+                yield sse_event("token", {"token": token})
+
+            response = {
+                "answer": "".join(tokens).strip(),
+                "query_intents": query_intents,
+                "contexts": results,
+                "response_metadata": format_response(results, query_intents)
+            }
+            answer_cache.put(query_vector, response)
+            metrics.count_request("answered")
+            done = with_timings(response, timer.finish())
+            yield sse_event("done", {key: done[key] for key in ("answer", "response_metadata", "timings") if key in done})
+
+        except PoolBusy:
+            metrics.count_request("busy")
+            yield sse_event("error", {"error": "Server is busy, please retry shortly", "retry_after": RETRY_AFTER})
+        except Exception as e:
+            print(f"Chat stream error: {e}")
+            metrics.count_request("error")
+            metrics.count_error("chat_stream")
+            yield sse_event("error", {"error": str(e)})
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify(answer_cache.stats())
+
+@app.route("/cache/invalidate", methods=["POST"])
+def cache_invalidate():
+    answer_cache.invalidate()
+    return jsonify({"message": "Answer cache cleared"})
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    if not metrics.enabled:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route("/llm/stats", methods=["GET"])
+def llm_stats():
+    if not is_ready():
+        return not_ready_response()
+    if retriever.llm_pool is None:
+        return jsonify({"replicas": 0, "mode": "in-process"})
+    return jsonify(retriever.llm_pool.stats())
+
 if __name__ == "__main__":
-    app.run(debug=True, port=5000)
+    parser = argparse.ArgumentParser(description="Medical RAG chat server")
+    parser.add_argument("--serve", choices=["dev", "production"], default="dev",
+                        help="Flask debug server, or a multi-threaded waitress server")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=SERVER_THREADS, help="Request threads in production mode")
+    parser.add_argument("--llm-workers", type=int, default=None,
+                        help=f"LLM replicas in worker processes (default {LLM_WORKERS} in dev mode, "
+                             f"{PRODUCTION_LLM_WORKERS} in production mode, where at least one is required)")
+    parser.add_argument("--max-pending", type=int, default=LLM_MAX_PENDING, help="Queued LLM requests before 503")
+    parser.add_argument("--no-metrics", action="store_true", help="Skip per-stage timings and the /metrics histograms")
+    args = parser.parse_args()
+    if args.llm_workers is None:
+        args.llm_workers = PRODUCTION_LLM_WORKERS if args.serve == "production" else LLM_WORKERS
+    if args.serve == "production" and args.llm_workers < 1:
+        parser.error("--serve production needs --llm-workers 1 or more; an in-process model has no request queue")
+
+    metrics.enabled = METRICS_ENABLED and not args.no_metrics
+
+    init_retriever(args.llm_workers, args.max_pending)
+    if args.serve == "production":
+        from waitress import serve
+        serve(app, host="0.0.0.0", port=args.port, threads=args.threads)
+    else:
+        app.run(debug=True, port=args.port, use_reloader=False)
@@ -0,0 +1,188 @@
+import os
+import time
+import socket
+import argparse
+import threading
+from datetime import datetime
+from bson import ObjectId
+from concurrent.futures import ProcessPoolExecutor
+import pymongo
+from pymongo import ReturnDocument
+from qdrant_client import QdrantClient
+from chunking import load_and_chunk_file, embed_texts, classify_texts, CLASSIFY_BATCH_SIZE
+from qdrant_ingest import (
+    ensure_collection, file_points, dedup_points, remove_stale_points, upsert_points, UPSERT_BATCH_SIZE
+)
+from dedup import NearDuplicateIndex
+from collection_version import bump_version
+from hybrid import QDRANT_URL, COLLECTION_NAME, MEDICAL_INTENTS
+from job_queue import (
+    JOBS_COLLECTION, REPORTS_COLLECTION, JOB_INDEXES, claimable, claim_update, progress_update, heartbeat_update,
+    retry_update, done_update
+)
+
+MONGO_URI = "mongodb://localhost:27017"
+UPLOAD_FOLDER = "reports"  # where main.py stores uploads
+WORKER_CONCURRENCY = 2  # jobs processed at once
+POLL_INTERVAL = 2.0  # seconds between queue checks when idle
+CLASSIFY_MODES = ["inline", "off"]
+
+class LeaseLost(Exception):
+    """The job's lease ran out and another worker claimed it"""
+
+class IngestionWorker:
+    """Claims jobs from the Mongo queue and chunks, embeds and upserts each report into Qdrant"""
+
+    def __init__(self, jobs, reports, qdrant, collection=COLLECTION_NAME, concurrency=WORKER_CONCURRENCY,
+                 classify="inline"):
+        self.jobs = jobs
+        self.reports = reports
+        self.qdrant = qdrant
+        self.collection = collection
+        self.concurrency = concurrency
+        self.classify = classify
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+        # PDF parsing is CPU-bound, so it runs in processes; the models are shared by the job threads
+        self.parse_pool = ProcessPoolExecutor(max_workers=concurrency)
+        self._classify_lock = threading.Lock()  # one generation pipeline, used by one thread at a time
+
+    def claim(self):
+        now = datetime.utcnow()
+        return self.jobs.find_one_and_update(
+            claimable(now), claim_update(self.name, now),
+            sort=[("next_attempt_at", pymongo.ASCENDING)], return_document=ReturnDocument.AFTER
+        )
+
+    def _update(self, job, update):
+        # Only while this worker still holds the job; after a lost lease another worker owns it
+        return self.jobs.update_one({"_id": job["_id"], "worker": self.name, "status": "running"}, update)
+
+    def _heartbeat(self, job, update=None):
+        if self._update(job, update or heartbeat_update(datetime.utcnow())).matched_count == 0:
+            raise LeaseLost(f"Job {job['_id']} was reclaimed by another worker")
+
+    def report_exists(self, job):
+        return self.reports.count_documents({"_id": ObjectId(job["report_id"])}, limit=1) > 0
+
+    def path_in_use(self, path):
+        # Files are content-addressed, so a report uploaded again after a delete reuses the same path
+        return self.reports.count_documents({"file_path": path}, limit=1) > 0
+
+    def remove_report_points(self, path):
+        if self.path_in_use(path):
+            return False
+        remove_stale_points(self.qdrant, self.collection, path, [])  # keeps none
+        return True
+
+    def process(self, job):
+        start = time.perf_counter()
+        try:
+            if job["kind"] == "delete":
+                self.remove_report_points(job["file_path"])
+                chunks = upserted = 0
+            else:
+                chunks, upserted = self.index_report(job)
+            bump_version(self.qdrant, self.collection)  # tells chat servers their cached answers may be stale
+        except LeaseLost as e:
+            print(f"⚠️ {e}; leaving it to that worker")
+            return
+        except Exception as e:
+            print(f"⚠️ Job {job['_id']} ({job['kind']} {job['file_path']}) failed on attempt {job['attempts']}: {e}")
+            self._update(job, retry_update(job, e, datetime.utcnow()))
+            return
+        elapsed = time.perf_counter() - start
+        self._update(job, done_update(chunks, upserted, elapsed, datetime.utcnow()))
+        print(f"✔️ {job['kind']} {job['file_path']}: {chunks} chunks, {upserted} upserted in {elapsed:.1f}s")
+
+    def index_report(self, job):
+        path = job["file_path"]
+        if not self.report_exists(job):
+            return 0, 0  # deleted while queued
+        chunks = self.parse_pool.submit(load_and_chunk_file, path).result()
+        # Repeated headers and disclaimers within the report; other reports are not compared against
+        points = dedup_points(file_points(UPLOAD_FOLDER, path, chunks), NearDuplicateIndex(), {})
+        remove_stale_points(self.qdrant, self.collection, path, [p["id"] for p in points])
+
+        upserted = 0
+        for offset in range(0, len(points), UPSERT_BATCH_SIZE):
+            if not self.report_exists(job):
+                break
+            batch = points[offset:offset + UPSERT_BATCH_SIZE]
+            # Batches finished by an earlier attempt are already in Qdrant under the same deterministic IDs
+            existing = {str(p.id) for p in self.qdrant.retrieve(self.collection, ids=[p["id"] for p in batch],
+                                                                with_payload=False, with_vectors=False)}
+            batch = [p for p in batch if p["id"] not in existing]
+            if batch:
+                texts = [p["text"] for p in batch]
+                vectors = embed_texts(texts)
+                intents = [[] for _ in batch]
+                if self.classify == "inline":
+                    # phi-2 on CPU can take longer than the lease for a whole batch, so renew it per sub-batch
+                    for first in range(0, len(texts), CLASSIFY_BATCH_SIZE):
+                        sub_batch = texts[first:first + CLASSIFY_BATCH_SIZE]
+                        with self._classify_lock:
+                            intents[first:first + len(sub_batch)] = classify_texts(
+                                sub_batch, "chunk", CLASSIFY_BATCH_SIZE, MEDICAL_INTENTS)
+                        self._heartbeat(job)
+                upserted += upsert_points(self.qdrant, self.collection, batch, vectors, intents)
+            self._heartbeat(job, progress_update(min(offset + UPSERT_BATCH_SIZE, len(points)), len(points),
+                                                 datetime.utcnow()))
+        if not self.report_exists(job):
+            # Deleted mid-run, maybe after its delete job already ran: undo what this job wrote,
+            # unless a re-upload of the same file owns the points now
+            self.remove_report_points(path)
+            return len(points), 0
+        return len(points), upserted
+
+    def _loop(self, drain):
+        while not self._stop.is_set():
+            job = self.claim()
+            if job is None:
+                if drain:
+                    return
+                self._stop.wait(POLL_INTERVAL)
+                continue
+            self.process(job)
+
+    def run(self, drain=False):
+        """Process jobs on `concurrency` threads until stopped, or until the queue is empty when draining"""
+        threads = [
+            threading.Thread(target=self._loop, args=(drain,), name=f"ingest-{i}", daemon=True)
+            for i in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=1.0)
+        except KeyboardInterrupt:
+            print("Stopping after the jobs in progress...")
+            self.stop()
+            for thread in threads:
+                thread.join()
+        self.parse_pool.shutdown()
+
+    def stop(self):
+        self._stop.set()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index uploaded reports into Qdrant from the Mongo ingestion queue")
+    parser.add_argument("--mongo", default=MONGO_URI)
+    parser.add_argument("--url", default=QDRANT_URL, help="Qdrant URL")
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY, help="Jobs processed at once")
+    parser.add_argument("--classify", choices=CLASSIFY_MODES, default="inline", help="Attach intent payloads or skip them")
+    parser.add_argument("--drain", action="store_true", help="Exit once the queue is empty instead of polling")
+    args = parser.parse_args()
+
+    db = pymongo.MongoClient(args.mongo)["healthapp"]
+    jobs = db[JOBS_COLLECTION]
+    jobs.create_indexes(JOB_INDEXES)
+    qdrant = QdrantClient(args.url)
+    # Loads the embedder before the job threads start, and sizes the collection if it is new
+    ensure_collection(qdrant, args.collection, embed_texts(["dimension probe"]).shape[1])
+
+    worker = IngestionWorker(jobs, db[REPORTS_COLLECTION], qdrant, args.collection, args.concurrency, args.classify)
+    worker.run(args.drain)
@@ -0,0 +1,170 @@
+import os
+import re
+import json
+import time
+import argparse
+import numpy as np
+
+INTENT_HEAD_PATH = "intent_head.npz"
+MIN_CONFIDENCE = 0.55  # cosine to the best centroid below which the LLM is asked instead
+SECOND_INTENT_MARGIN = 0.02  # a second intent is kept when it scores within this of the best
+CV_FOLDS = 5
+
+class IntentHead:
+    """Nearest-centroid intent classifier over query embeddings; a prediction is one matrix-vector product"""
+
+    def __init__(self, labels, centroids, min_confidence=MIN_CONFIDENCE):
+        self.labels = list(labels)
+        centroids = np.asarray(centroids, dtype=np.float32)
+        self.centroids = centroids / np.linalg.norm(centroids, axis=1, keepdims=True)
+        self.min_confidence = min_confidence
+
+    @classmethod
+    def train(cls, vectors, label_sets, labels, **kwargs):
+        """One centroid per label from the unit-length vectors of its examples; multi-label examples count for each"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        kept, centroids = [], []
+        for label in labels:
+            rows = [i for i, example_labels in enumerate(label_sets) if label in example_labels]
+            if rows:
+                kept.append(label)
+                centroids.append(vectors[rows].mean(axis=0))
+        return cls(kept, np.stack(centroids), **kwargs)
+
+    def scores(self, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return self.centroids @ (vector / norm if norm else vector)
+
+    def predict(self, vector):
+        """(1-2 intents, confident); unsure predictions are left to the LLM by the caller"""
+        scores = self.scores(vector)
+        order = np.argsort(scores)[::-1]
+        best, runner_up = scores[order[0]], scores[order[1]] if len(order) > 1 else -1.0
+        intents = [self.labels[order[0]]]
+        if best - runner_up <= SECOND_INTENT_MARGIN:
+            intents.append(self.labels[order[1]])
+        return intents, bool(best >= self.min_confidence)
+
+    def save(self, path=INTENT_HEAD_PATH):
+        np.savez(path, labels=np.array(self.labels), centroids=self.centroids,
+                 min_confidence=np.array(self.min_confidence))
+
+    @classmethod
+    def load(cls, path=INTENT_HEAD_PATH):
+        with np.load(path) as data:
+            return cls(data["labels"].tolist(), data["centroids"], float(data["min_confidence"]))
+
+def training_examples(intent_rules, test_data, labels):
+    """(text, intents) pairs from the rule descriptions and examples in the prompt, and the labelled questions"""
+    from benchmark import question_intents
+    examples = []
+    for label, description in re.findall(r"^\d+\.\s*(\S+)\s*-\s*(.+)$", intent_rules, re.MULTILINE):
+        examples.append((description.strip(), [label]))
+    for text, label in re.findall(r'^-\s*"(.+)"\s*→\s*(\S+)$', intent_rules, re.MULTILINE):
+        examples.append((text, [label]))
+    for example in test_data:
+        intents = [intent for intent in question_intents(example) if intent in labels]
+        if intents:
+            examples.append((example["question"], intents))
+    return examples
+
+def cross_validated_predictions(vectors, label_sets, labels, test_rows, folds=CV_FOLDS):
+    """Predict every labelled question with a head that never saw it"""
+    predictions = {}
+    rows = np.array(test_rows)
+    for fold in range(folds):
+        held_out = set(rows[fold::folds].tolist())
+        train_rows = [i for i in range(len(label_sets)) if i not in held_out]
+        head = IntentHead.train(vectors[train_rows], [label_sets[i] for i in train_rows], labels)
+        for i in held_out:
+            predictions[i] = head.predict(vectors[i])
+    return predictions
+
+def agreement(predicted, reference):
+    predicted, reference = set(predicted), set(reference)
+    return {
+        "exact": float(predicted == reference),
+        "overlap": float(bool(predicted & reference)),
+        "jaccard": len(predicted & reference) / len(predicted | reference) if predicted | reference else 1.0,
+    }
+
+def mean_agreement(pairs):
+    if not pairs:
+        return {}
+    scores = [agreement(predicted, reference) for predicted, reference in pairs]
+    return {key: round(float(np.mean([s[key] for s in scores])), 4) for key in scores[0]}
+
+if __name__ == "__main__":
+    from sentence_transformers import SentenceTransformer
+    from embedding_cache import EmbeddingCache
+    from hybrid import EMBEDDING_MODEL, MEDICAL_INTENTS, INTENT_RULES
+
+    parser = argparse.ArgumentParser(description="Train the embedding intent head and compare it with the LLM classifier")
+    parser.add_argument("command", choices=["train", "benchmark"])
+    parser.add_argument("--data", default="test_dataset_with_intents.json")
+    parser.add_argument("--output", default=INTENT_HEAD_PATH)
+    parser.add_argument("--min-confidence", type=float, default=MIN_CONFIDENCE)
+    parser.add_argument("--llm-labels", default="llm_intent_labels.json",
+                        help="LLM intents per question, reused across benchmark runs")
+    parser.add_argument("--report", default="intent_head_benchmark.json")
+    args = parser.parse_args()
+
+    with open(args.data, encoding="utf-8") as f:
+        test_data = json.load(f)
+    examples = training_examples(INTENT_RULES, test_data, MEDICAL_INTENTS)
+    model = SentenceTransformer(EMBEDDING_MODEL)
+    # The same cache hybrid.py reads query vectors from
+    vectors = EmbeddingCache(EMBEDDING_MODEL).embed([text for text, _ in examples], model.encode)
+    label_sets = [intents for _, intents in examples]
+
+    if args.command == "train":
+        head = IntentHead.train(vectors, label_sets, MEDICAL_INTENTS, min_confidence=args.min_confidence)
+        head.save(args.output)
+        print(f"✔️ Intent head with {len(head.labels)} centroids from {len(examples)} examples saved to {args.output}")
+    else:
+        from hybrid import EnhancedMedicalRetriever
+
+        questions = {text: i for i, (text, _) in enumerate(examples)}
+        test_rows = [questions[example["question"]] for example in test_data if example["question"] in questions]
+
+        llm_labels = {}
+        if os.path.exists(args.llm_labels):
+            with open(args.llm_labels, encoding="utf-8") as f:
+                llm_labels = json.load(f)
+        missing = [examples[i][0] for i in test_rows if examples[i][0] not in llm_labels]
+        llm_ms = []
+        if missing:
+            retriever = EnhancedMedicalRetriever()
+            retriever._load_llm()
+            for query in missing:
+                start = time.perf_counter()
+                llm_labels[query] = retriever.classify_intents(query)
+                llm_ms.append((time.perf_counter() - start) * 1000)
+            with open(args.llm_labels, "w", encoding="utf-8") as f:
+                json.dump(llm_labels, f, indent=2)
+
+        predictions = cross_validated_predictions(vectors, label_sets, MEDICAL_INTENTS, test_rows)
+        head = IntentHead.train(vectors, label_sets, MEDICAL_INTENTS, min_confidence=args.min_confidence)
+        start = time.perf_counter()
+        for i in test_rows:
+            head.predict(vectors[i])
+        head_us = (time.perf_counter() - start) / max(len(test_rows), 1) * 1e6
+
+        confident = [i for i in test_rows if predictions[i][1]]
+        report = {
+            "questions": len(test_rows),
+            "min_confidence": args.min_confidence,
+            "llm_fallback_rate": round(1 - len(confident) / max(len(test_rows), 1), 4),
+            "head_vs_llm": mean_agreement([(predictions[i][0], llm_labels[examples[i][0]]) for i in test_rows]),
+            "head_vs_llm_confident_only": mean_agreement(
+                [(predictions[i][0], llm_labels[examples[i][0]]) for i in confident]),
+            "head_vs_gold": mean_agreement([(predictions[i][0], label_sets[i]) for i in test_rows]),
+            "llm_vs_gold": mean_agreement([(llm_labels[examples[i][0]], label_sets[i]) for i in test_rows]),
+            "head_us_per_query": round(head_us, 2),
+            "llm_ms_per_query": round(float(np.mean(llm_ms)), 1) if llm_ms else None,
+        }
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta
+import pymongo
+
+# Shared by main.py (enqueue, status) and ingest_worker.py (claim, run); kept free of model imports
+JOBS_COLLECTION = "ingestion_jobs"
+REPORTS_COLLECTION = "medical_reports"
+JOB_KINDS = ["index", "delete"]
+JOB_STATUSES = ["queued", "running", "done", "failed"]
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF = 30  # seconds before the first retry, doubled on every further attempt
+LEASE_SECONDS = 900  # a running job whose worker stops renewing this is handed to another worker
+
+JOB_INDEXES = [
+    pymongo.IndexModel([("status", pymongo.ASCENDING), ("next_attempt_at", pymongo.ASCENDING)]),
+    pymongo.IndexModel([("status", pymongo.ASCENDING), ("lease_until", pymongo.ASCENDING)]),
+    pymongo.IndexModel([("status", pymongo.ASCENDING), ("finished_at", pymongo.DESCENDING)]),
+    pymongo.IndexModel([("report_id", pymongo.ASCENDING), ("kind", pymongo.ASCENDING)]),
+]
+
+def new_job(report_id, file_path, kind="index"):
+    now = datetime.utcnow()
+    return {
+        "report_id": str(report_id),
+        "kind": kind,
+        "file_path": file_path,
+        "status": "queued",
+        "attempts": 0,
+        "next_attempt_at": now,
+        "created_at": now,
+        "updated_at": now,
+        "last_error": None,
+    }
+
+def claimable(now):
+    """Queued jobs that are due, and running jobs whose worker's lease ran out"""
+    return {"$or": [
+        {"status": "queued", "next_attempt_at": {"$lte": now}},
+        {"status": "running", "lease_until": {"$lt": now}},
+    ]}
+
+def claim_update(worker, now):
+    return {
+        "$set": {
+            "status": "running",
+            "worker": worker,
+            "started_at": now,
+            "updated_at": now,
+            "lease_until": now + timedelta(seconds=LEASE_SECONDS),
+        },
+        "$inc": {"attempts": 1},
+    }
+
+def progress_update(done, total, now):
+    # Doubles as the lease heartbeat
+    return {"$set": {
+        "progress": {"chunks_done": done, "chunks_total": total},
+        "updated_at": now,
+        "lease_until": now + timedelta(seconds=LEASE_SECONDS),
+    }}
+
+def heartbeat_update(now):
+    return {"$set": {"updated_at": now, "lease_until": now + timedelta(seconds=LEASE_SECONDS)}}
+
+def retry_update(job, error, now):
+    if job["attempts"] >= MAX_ATTEMPTS:
+        return {"$set": {"status": "failed", "last_error": str(error), "finished_at": now, "updated_at": now,
+                         "lease_until": None}}
+    delay = RETRY_BACKOFF * 2 ** (job["attempts"] - 1)
+    return {"$set": {"status": "queued", "last_error": str(error), "updated_at": now, "lease_until": None,
+                     "next_attempt_at": now + timedelta(seconds=delay)}}
+
+def done_update(chunks, upserted, seconds, now):
+    return {"$set": {
+        "status": "done",
+        "chunks": chunks,
+        "upserted": upserted,
+        "seconds": round(seconds, 3),
+        "chunks_per_second": round(chunks / seconds, 2) if seconds > 0 else None,
+        "finished_at": now,
+        "updated_at": now,
+        "lease_until": None,
+        "last_error": None,
+    }}
+
+def job_summary(job):
+    summary = {
+        key: job.get(key) for key in (
+            "report_id", "kind", "status", "attempts", "progress", "chunks", "upserted", "seconds",
+            "chunks_per_second", "last_error"
+        )
+    }
+    summary["id"] = str(job["_id"])
+    for key in ("created_at", "started_at", "finished_at", "next_attempt_at"):
+        summary[key] = job[key].isoformat() if job.get(key) else None
+    return summary
@@ -0,0 +1,268 @@
+import os
+import itertools
+import threading
+import queue
+import multiprocessing as mp
+from collections import deque
+from multiprocessing.connection import wait as wait_for
+
+TASK_TIMEOUT = 600  # seconds a completion may take before its worker is presumed hung and replaced
+TOKEN_TIMEOUT = 120  # seconds a stream may go without a token, prompt evaluation included
+MONITOR_INTERVAL = 1.0
+
+class PoolBusy(Exception):
+    """Raised when every replica is busy and the pending queue is full"""
+
+class PoolTimeout(RuntimeError):
+    """Raised when a worker did not answer in time; the worker is restarted"""
+
+def _worker(model_kwargs, prefixes, conn):
+    # Runs in its own process with its own model copy, so replicas never share llama.cpp state
+    from langchain_community.llms import LlamaCpp
+    from prompt_cache import PrefixCachedLlama
+    llm = PrefixCachedLlama(LlamaCpp(**model_kwargs), prefixes)
+    conn.send((None, "ready", os.getpid()))
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        task_id, kind, prompt, kwargs = task
+        try:
+            if kind == "stream":
+                for token in llm.stream(prompt, **kwargs):
+                    conn.send((task_id, "token", token))
+                conn.send((task_id, "done", None))
+            else:
+                conn.send((task_id, "done", llm(prompt, **kwargs)))
+        except Exception as e:
+            conn.send((task_id, "error", repr(e)))
+
+class _Replica:
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.ready = False
+        self.task_id = None  # one task at a time; the rest wait in the pool's pending queue
+
+class LLMPool:
+    """LlamaCpp replicas in worker processes behind a bounded queue; callable like LlamaCpp itself
+
+    Each replica has its own pipe and is handed one task at a time, so a worker that crashes or is
+    OOM-killed takes down nothing but its current task: the dispatcher sees its process exit, fails that
+    task and starts a replacement.
+    """
+
+    def __init__(self, replicas=2, max_pending=8, prefixes=(), **model_kwargs):
+        model_kwargs.setdefault("n_threads", max(1, (os.cpu_count() or 1) // replicas))
+        # Spawn rather than fork: the parent already holds torch and Flask threads
+        self._ctx = mp.get_context("spawn")
+        self._model_kwargs = model_kwargs
+        self._prefixes = list(prefixes)
+        self.replicas = replicas
+        self.max_pending = max_pending
+        self.capacity = replicas + max_pending
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._in_flight = 0
+        self._lock = threading.Lock()  # guards the replicas, the pending queue and the counters
+        self._pending = deque()
+        self._waiters = {}
+        self._ids = itertools.count()
+        self.ready_workers = 0
+        self.restarts = 0
+        self._all_ready = threading.Event()
+        self._closed = False
+        self._replicas = [self._spawn() for _ in range(replicas)]
+        threading.Thread(target=self._dispatch, daemon=True, name="llm-pool-dispatch").start()
+
+    def _spawn(self):
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(target=_worker, args=(self._model_kwargs, self._prefixes, child_conn),
+                                    daemon=True)
+        process.start()
+        child_conn.close()
+        return _Replica(process, parent_conn)
+
+    def _dispatch(self):
+        while not self._closed:
+            with self._lock:
+                replicas = list(self._replicas)
+            conns = {replica.conn: replica for replica in replicas}
+            sentinels = {replica.process.sentinel: replica for replica in replicas}
+            ready = wait_for(list(conns) + list(sentinels), timeout=MONITOR_INTERVAL)
+            # Messages first, so results a worker sent just before exiting are still delivered
+            for conn in [c for c in ready if c in conns]:
+                try:
+                    self._handle(conns[conn], conn.recv())
+                except (EOFError, OSError):
+                    pass  # the worker is gone; its sentinel reports it
+            for sentinel in [s for s in ready if s in sentinels]:
+                self._replace(sentinels[sentinel])
+
+    def _handle(self, replica, message):
+        task_id, kind, value = message
+        with self._lock:
+            if kind == "ready":
+                replica.ready = True
+                self.ready_workers += 1
+                if self.ready_workers == self.replicas:
+                    self._all_ready.set()
+            else:
+                waiter = self._waiters.get(task_id)
+                if waiter is not None:
+                    waiter.put((kind, value))
+                if kind in ("done", "error"):
+                    # The slot is freed when the worker finishes, even if the caller stopped listening
+                    self._finish(task_id)
+                    replica.task_id = None
+            self._assign(replica)
+
+    def _finish(self, task_id):
+        # Called with self._lock held
+        self._waiters.pop(task_id, None)
+        self._in_flight -= 1
+        self._slots.release()
+
+    def _assign(self, replica):
+        # Called with self._lock held
+        while replica.ready and replica.task_id is None and self._pending:
+            task = self._pending.popleft()
+            try:
+                replica.conn.send(task)
+            except (BrokenPipeError, OSError):
+                self._pending.appendleft(task)  # the sentinel will replace this worker
+                return
+            replica.task_id = task[0]
+
+    def _replace(self, replica):
+        replica.process.join(timeout=1)  # the sentinel can fire before the exit code is collected
+        exitcode = replica.process.exitcode
+        with self._lock:
+            if replica not in self._replicas:
+                return
+            if replica.task_id is not None:
+                waiter = self._waiters.get(replica.task_id)
+                if waiter is not None:
+                    waiter.put(("error", f"LLM worker {replica.process.pid} exited with code {exitcode}"))
+                self._finish(replica.task_id)
+            replica.conn.close()
+            index = self._replicas.index(replica)
+            if self._closed:
+                return
+            if not replica.ready:
+                # It never loaded the model, so a replacement would most likely fail the same way
+                print(f"⚠️ LLM worker {replica.process.pid} failed to start (exit code {exitcode})")
+                del self._replicas[index]
+                self.replicas -= 1
+                if not self._replicas:
+                    self._fail_pending("No LLM workers are running")
+                # Wakes wait_ready: either the workers left are all ready, or none are left and it raises
+                if self.ready_workers == self.replicas:
+                    self._all_ready.set()
+                return
+            self.ready_workers -= 1
+            self.restarts += 1
+            print(f"⚠️ LLM worker {replica.process.pid} exited with code {exitcode}, starting a replacement")
+            self._replicas[index] = self._spawn()
+
+    def _fail_pending(self, message):
+        # Called with self._lock held
+        while self._pending:
+            task_id = self._pending.popleft()[0]
+            waiter = self._waiters.get(task_id)
+            if waiter is not None:
+                waiter.put(("error", message))
+            self._finish(task_id)
+
+    def _submit(self, kind, prompt, kwargs):
+        if not self._slots.acquire(blocking=False):
+            raise PoolBusy(f"All {self.replicas} LLM workers are busy and {self.max_pending} requests are queued")
+        task_id = next(self._ids)
+        waiter = queue.Queue()
+        with self._lock:
+            self._in_flight += 1
+            self._waiters[task_id] = waiter
+            self._pending.append((task_id, kind, prompt, kwargs))
+            if not self._replicas:
+                self._fail_pending("No LLM workers are running")
+            for replica in self._replicas:
+                self._assign(replica)
+        return task_id, waiter
+
+    def _abandon(self, task_id):
+        """Give up on a task that timed out: drop it if still queued, or restart the worker running it"""
+        with self._lock:
+            for task in self._pending:
+                if task[0] == task_id:
+                    self._pending.remove(task)
+                    self._finish(task_id)
+                    return
+            self._waiters.pop(task_id, None)
+            for replica in self._replicas:
+                if replica.task_id == task_id:
+                    replica.process.terminate()  # the dispatcher frees the slot and replaces it
+
+    def _get(self, task_id, waiter, timeout):
+        try:
+            return waiter.get(timeout=timeout)
+        except queue.Empty:
+            self._abandon(task_id)
+            raise PoolTimeout(f"LLM worker gave no output for {timeout}s")
+
+    def wait_ready(self, timeout=None):
+        """Block until every replica that started has loaded its model; raises if none of them started"""
+        ready = self._all_ready.wait(timeout)
+        if ready and not self.replicas:
+            raise RuntimeError("No LLM worker could load the model")
+        return ready
+
+    def is_full(self):
+        with self._lock:
+            return self._in_flight >= self.capacity
+
+    def stats(self):
+        with self._lock:
+            return {
+                "replicas": self.replicas,
+                "ready_workers": self.ready_workers,
+                "in_flight": self._in_flight,
+                "capacity": self.capacity,
+                "restarts": self.restarts,
+            }
+
+    def __call__(self, prompt, **kwargs):
+        task_id, waiter = self._submit("complete", prompt, kwargs)
+        kind, value = self._get(task_id, waiter, TASK_TIMEOUT)
+        if kind == "error":
+            raise RuntimeError(value)
+        return value
+
+    def stream(self, prompt, **kwargs):
+        task_id, waiter = self._submit("stream", prompt, kwargs)
+        try:
+            while True:
+                kind, value = self._get(task_id, waiter, TOKEN_TIMEOUT)
+                if kind == "token":
+                    yield value
+                elif kind == "done":
+                    return
+                else:
+                    raise RuntimeError(value)
+        finally:
+            # Remaining tokens of an abandoned stream are dropped by the dispatcher
+            with self._lock:
+                self._waiters.pop(task_id, None)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            replicas = list(self._replicas)
+        for replica in replicas:
+            try:
+                replica.conn.send(None)
+            except OSError:
+                pass
+        for replica in replicas:
+            replica.process.join(timeout=5)
@@ -1,125 +1,383 @@
-import streamlit as st
-import requests
-import os
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
-from threading import Thread
-from datetime import datetime
-from motor.motor_asyncio import AsyncIOMotorClient
-import pymongo
-from bson import ObjectId
-import base64
-
-# --- FASTAPI BACKEND SETUP ---
-app = FastAPI()
-
-UPLOAD_FOLDER = "reports"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-
-client = AsyncIOMotorClient("mongodb://localhost:27017")
-db = client["healthapp"]
-collection = db["medical_reports"]
-
-@app.post("/upload-report/")
-async def upload_report(file: UploadFile = File(...)):
-    file_location = os.path.join(UPLOAD_FOLDER, file.filename)
-
-    # Check if already exists
-    if await collection.find_one({"filename": file.filename}):
-        return {"message": "Already exists"}
-
-    with open(file_location, "wb") as f:
-        f.write(await file.read())
-
-    await collection.insert_one({
-        "filename": file.filename,
-        "file_path": file_location,
-        "uploaded_at": datetime.utcnow()
-    })
-
-    return {"message": "Uploaded", "filename": file.filename}
-
-@app.delete("/delete-report/{report_id}")
-async def delete_report(report_id: str):
-    try:
-        report = await collection.find_one({"_id": ObjectId(report_id)})
-    except Exception as e:
-        raise HTTPException(status_code=400, detail="Invalid ID format")
-
-    if not report:
-        raise HTTPException(status_code=404, detail="Report not found")
-
-    if os.path.exists(report["file_path"]):
-        os.remove(report["file_path"])
-
-    await collection.delete_one({"_id": ObjectId(report_id)})
-    return {"message": "Deleted", "filename": report["filename"]}
-
-def run_fastapi():
-    uvicorn.run(app, host="127.0.0.1", port=8000)
-
-# Start FastAPI in background
-if "api_started" not in st.session_state:
-    thread = Thread(target=run_fastapi, daemon=True)
-    thread.start()
-    st.session_state.api_started = True
-
-# --- STREAMLIT FRONTEND ---
-st.title("🩺 Medical Report Uploader")
-
-uploaded_file = st.file_uploader("Upload your medical report", type=["pdf", "jpg", "png"])
-
-if uploaded_file is not None:
-    # Always try to upload when a new file is selected
-    response = requests.post(
-        "http://127.0.0.1:8000/upload-report/",
-        files={"file": (uploaded_file.name, uploaded_file.getvalue())}
-    )
-
-    if response.status_code == 200:
-        if response.json().get("message") == "Uploaded":
-            st.success("✅ Report uploaded successfully!")
-        elif response.json().get("message") == "Already exists":
-            st.warning("⚠️ Report already exists.")
-        else:
-            st.warning(response.json().get("message"))
-        st.rerun()
-    else:
-        st.error("❌ Upload failed!")
-
-
-# --- DISPLAY UPLOADED REPORTS ---
-st.markdown("---")
-st.subheader("📁 Uploaded Reports")
-
-sync_client = pymongo.MongoClient("mongodb://localhost:27017")
-sync_collection = sync_client["healthapp"]["medical_reports"]
-reports = list(sync_collection.find().sort("uploaded_at", -1))
-
-if reports:
-    for report in reports:
-        col1, col2, col3 = st.columns([4, 2, 2])
-
-        with col1:
-            st.write(f"📄 **{report['filename']}**")
-            st.write(f"🕒 Uploaded: {report['uploaded_at'].strftime('%Y-%m-%d %H:%M:%S')}")
-
-        with col2:
-            if os.path.exists(report["file_path"]):
-                with open(report["file_path"], "rb") as f:
-                    b64 = base64.b64encode(f.read()).decode()
-                    href = f'<a href="data:application/octet-stream;base64,{b64}" download="{report["filename"]}">📥 Download</a>'
-                    st.markdown(href, unsafe_allow_html=True)
-
-        with col3:
-            if st.button("🗑️ Delete", key=str(report["_id"])):
-                delete_url = f"http://127.0.0.1:8000/delete-report/{str(report['_id'])}"
-                response = requests.delete(delete_url)
-                if response.status_code == 200:
-                    st.success(f"Deleted {report['filename']}")
-                    st.rerun()
-                else:
-                    st.error(f"Failed to delete: {response.text}")
-else:
-    st.info("No reports uploaded yet.")
+import streamlit as st
+import requests
+import os
+import re
+import hashlib
+import tempfile
+import mimetypes
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+from typing import Optional
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from fastapi.middleware.cors import CORSMiddleware
+import uvicorn
+from threading import Thread
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorClient
+import pymongo
+from pymongo.errors import DuplicateKeyError
+from bson import ObjectId
+from bson.errors import InvalidId
+from job_queue import JOBS_COLLECTION, REPORTS_COLLECTION, JOB_INDEXES, JOB_STATUSES, new_job, job_summary
+
+# --- FASTAPI BACKEND SETUP ---
+app = FastAPI()
+
+UPLOAD_FOLDER = "reports"
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # bytes read, hashed and written per step
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+API_URL = "http://127.0.0.1:8000"
+MONGO_URI = "mongodb://localhost:27017"
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+INGESTED_EXTENSIONS = [".pdf"]  # uploads that ingest_worker.py indexes for the chatbot
+THROUGHPUT_WINDOW = 50  # recent finished jobs averaged in /ingestion-jobs/stats
+os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+
+client = AsyncIOMotorClient(MONGO_URI)
+db = client["healthapp"]
+collection = db[REPORTS_COLLECTION]
+jobs = db[JOBS_COLLECTION]
+
+# Newest-first listing (with _id to break ties), the duplicate check, and the shared-file check on delete
+REPORT_INDEXES = [
+    pymongo.IndexModel([("uploaded_at", pymongo.DESCENDING), ("_id", pymongo.DESCENDING)]),
+    # Reports uploaded before content hashing have no sha256, so they are left out of the unique index
+    pymongo.IndexModel([("sha256", pymongo.ASCENDING)], unique=True,
+                       partialFilterExpression={"sha256": {"$type": "string"}}),
+    pymongo.IndexModel([("file_path", pymongo.ASCENDING)]),
+]
+PAGE_SORT = [("uploaded_at", pymongo.DESCENDING), ("_id", pymongo.DESCENDING)]
+REPORT_FIELDS = {"filename": 1, "uploaded_at": 1, "size": 1, "sha256": 1}
+
+@app.on_event("startup")
+async def create_indexes():
+    await collection.create_indexes(REPORT_INDEXES)
+    await jobs.create_indexes(JOB_INDEXES)
+
+async def enqueue_job(report_id, file_path, kind):
+    # At most one pending job per report and kind; re-enqueueing resets it
+    await jobs.replace_one({"report_id": str(report_id), "kind": kind}, new_job(report_id, file_path, kind), upsert=True)
+
+def encode_cursor(report):
+    return f"{report['uploaded_at'].isoformat()}_{report['_id']}"
+
+def page_filter(cursor):
+    """Reports strictly after the cursor in (uploaded_at, _id) order; an index range scan, never a skip"""
+    if not cursor:
+        return {}
+    uploaded_at, report_id = cursor.rsplit("_", 1)
+    uploaded_at, report_id = datetime.fromisoformat(uploaded_at), ObjectId(report_id)
+    return {"$or": [
+        {"uploaded_at": {"$lt": uploaded_at}},
+        {"uploaded_at": uploaded_at, "_id": {"$lt": report_id}},
+    ]}
+
+def report_summary(report):
+    return {
+        "id": str(report["_id"]),
+        "filename": report["filename"],
+        "uploaded_at": report["uploaded_at"].isoformat(),
+        "size": report.get("size"),
+        "sha256": report.get("sha256"),
+    }
+
+def _write_chunk(f, digest, chunk):
+    digest.update(chunk)
+    f.write(chunk)
+
+async def save_upload(file: UploadFile):
+    """Stream an upload to a temporary file, hashing it on the way; returns (temp path, sha256, size)"""
+    fd, temp_path = await run_in_threadpool(tempfile.mkstemp, dir=UPLOAD_FOLDER, suffix=".part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            # Only one chunk is held in memory; disk writes and hashing stay off the event loop
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await run_in_threadpool(_write_chunk, f, digest, chunk)
+                size += len(chunk)
+    except BaseException:
+        await run_in_threadpool(os.remove, temp_path)
+        raise
+    return temp_path, digest.hexdigest(), size
+
+def content_path(sha256, filename):
+    # Stored under the content hash: identical files share one path, whatever they were called
+    return os.path.join(UPLOAD_FOLDER, sha256 + os.path.splitext(filename)[1].lower())
+
+@app.post("/upload-report/")
+async def upload_report(file: UploadFile = File(...)):
+    temp_path, sha256, size = await save_upload(file)
+    file_location = content_path(sha256, file.filename)
+
+    # The unique sha256 index is the duplicate check: the same content under any name, even in concurrent uploads
+    try:
+        result = await collection.insert_one({
+            "filename": file.filename,
+            "file_path": file_location,
+            "sha256": sha256,
+            "size": size,
+            "uploaded_at": datetime.utcnow()
+        })
+    except DuplicateKeyError:
+        await run_in_threadpool(os.remove, temp_path)
+        existing = await collection.find_one({"sha256": sha256}, {"filename": 1})
+        return {"message": "Already exists", "filename": existing["filename"] if existing else file.filename}
+
+    try:
+        await run_in_threadpool(os.replace, temp_path, file_location)
+    except OSError:
+        await collection.delete_one({"_id": result.inserted_id})
+        raise
+
+    # Indexing happens in ingest_worker.py; the upload only records the job
+    ingestion = None
+    if os.path.splitext(file_location)[1] in INGESTED_EXTENSIONS:
+        # A deleted report with the same content shares this path; its pending cleanup must not run now
+        await jobs.delete_many({"file_path": file_location, "kind": "delete", "status": "queued"})
+        await enqueue_job(result.inserted_id, file_location, "index")
+        ingestion = "queued"
+
+    return {"message": "Uploaded", "filename": file.filename, "sha256": sha256, "id": str(result.inserted_id),
+            "ingestion": ingestion}
+
+@app.get("/reports/")
+async def list_reports(limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None):
+    try:
+        query = page_filter(cursor)
+    except (ValueError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    # One extra document tells whether another page follows
+    reports = await collection.find(query, REPORT_FIELDS).sort(PAGE_SORT).limit(limit + 1).to_list(limit + 1)
+    return {
+        "reports": [report_summary(report) for report in reports[:limit]],
+        "next_cursor": encode_cursor(reports[limit - 1]) if len(reports) > limit else None
+    }
+
+@app.delete("/delete-report/{report_id}")
+async def delete_report(report_id: str):
+    try:
+        report = await collection.find_one({"_id": ObjectId(report_id)})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail="Invalid ID format")
+
+    if not report:
+        raise HTTPException(status_code=404, detail="Report not found")
+
+    await collection.delete_one({"_id": ObjectId(report_id)})
+
+    # Content-addressed files may still back another report
+    if not await collection.find_one({"file_path": report["file_path"]}):
+        if os.path.exists(report["file_path"]):
+            await run_in_threadpool(os.remove, report["file_path"])
+        if os.path.splitext(report["file_path"])[1] in INGESTED_EXTENSIONS:
+            await jobs.delete_many({"report_id": report_id, "kind": "index", "status": "queued"})
+            await enqueue_job(report_id, report["file_path"], "delete")
+    return {"message": "Deleted", "filename": report["filename"]}
+
+@app.get("/ingestion-jobs/stats")
+async def ingestion_stats():
+    # Per-status counts and recent throughput, each answered from an index
+    counts = {status: await jobs.count_documents({"status": status}) for status in JOB_STATUSES}
+    recent = await jobs.find(
+        {"status": "done", "kind": "index"}, {"chunks": 1, "seconds": 1}
+    ).sort("finished_at", pymongo.DESCENDING).limit(THROUGHPUT_WINDOW).to_list(THROUGHPUT_WINDOW)
+    chunks = sum(job.get("chunks") or 0 for job in recent)
+    seconds = sum(job.get("seconds") or 0 for job in recent)
+    return {
+        "jobs": counts,
+        "recent_jobs": len(recent),
+        "recent_chunks": chunks,
+        "chunks_per_second": round(chunks / seconds, 2) if seconds else None,
+    }
+
+@app.get("/ingestion-jobs/{report_id}")
+async def ingestion_status(report_id: str):
+    report_jobs = await jobs.find({"report_id": report_id}).to_list(len(JOB_STATUSES))
+    if not report_jobs:
+        raise HTTPException(status_code=404, detail="No ingestion jobs for this report")
+    return {"report_id": report_id, "jobs": [job_summary(job) for job in report_jobs]}
+
+def parse_range(header, size):
+    """(start, end) of a single "bytes=" range, None to send the whole file, or raise 416"""
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", header.strip())
+    if not match or match.groups() == ("", ""):
+        return None  # multiple or malformed ranges: ignoring the header is allowed
+    first, last = match.groups()
+    if first:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    else:
+        start, end = max(size - int(last), 0), size - 1  # suffix range: the last N bytes
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+def iter_file(path, start, length):
+    # A plain generator: Starlette runs it in the thread pool, so reads never block the event loop
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(DOWNLOAD_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+def not_modified(request, etag, mtime):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+@app.api_route("/download-report/{report_id}", methods=["GET", "HEAD"])
+async def download_report(report_id: str, request: Request):
+    try:
+        report = await collection.find_one({"_id": ObjectId(report_id)})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail="Invalid ID format")
+
+    if not report:
+        raise HTTPException(status_code=404, detail="Report not found")
+
+    try:
+        stat = await run_in_threadpool(os.stat, report["file_path"])
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Report file missing")
+
+    # Content-addressed reports have a natural strong validator; older ones fall back to size and mtime
+    etag = f'"{report["sha256"]}"' if report.get("sha256") else f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f"attachment; filename*=UTF-8''{quote(report['filename'])}",
+    }
+    if not_modified(request, etag, stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    media_type = mimetypes.guess_type(report["filename"])[0] or "application/octet-stream"
+    start, end, status_code = 0, stat.st_size - 1, 200
+    range_header = request.headers.get("range")
+    # If-Range: only honour the range while the client's copy is still current
+    if range_header and stat.st_size and request.headers.get("if-range", etag) in (etag, headers["Last-Modified"]):
+        byte_range = parse_range(range_header, stat.st_size)
+        if byte_range:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+
+    length = end - start + 1
+    headers["Content-Length"] = str(length)
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+    return StreamingResponse(iter_file(report["file_path"], start, length), status_code=status_code,
+                             headers=headers, media_type=media_type)
+
+def run_fastapi():
+    uvicorn.run(app, host="127.0.0.1", port=8000)
+
+# Start FastAPI in background
+if "api_started" not in st.session_state:
+    thread = Thread(target=run_fastapi, daemon=True)
+    thread.start()
+    st.session_state.api_started = True
+
+# --- STREAMLIT FRONTEND ---
+st.title("🩺 Medical Report Uploader")
+
+uploaded_file = st.file_uploader("Upload your medical report", type=["pdf", "jpg", "png"])
+
+if uploaded_file is not None:
+    # Always try to upload when a new file is selected
+    response = requests.post(
+        f"{API_URL}/upload-report/",
+        files={"file": (uploaded_file.name, uploaded_file.getvalue())}
+    )
+
+    if response.status_code == 200:
+        if response.json().get("message") == "Uploaded":
+            st.success("✅ Report uploaded successfully!")
+        elif response.json().get("message") == "Already exists":
+            st.warning("⚠️ Report already exists.")
+        else:
+            st.warning(response.json().get("message"))
+        st.session_state.report_cursors = [None]  # back to the first page, where the new report is
+        st.rerun()
+    else:
+        st.error("❌ Upload failed!")
+
+
+# --- DISPLAY UPLOADED REPORTS ---
+st.markdown("---")
+st.subheader("📁 Uploaded Reports")
+
+@st.cache_resource
+def get_reports_collection():
+    # One client, and its connection pool, shared by every rerun and session
+    sync_client = pymongo.MongoClient(MONGO_URI)
+    reports_collection = sync_client["healthapp"]["medical_reports"]
+    reports_collection.create_indexes(REPORT_INDEXES)
+    return reports_collection
+
+sync_collection = get_reports_collection()
+
+# Cursor of every page visited so far, so "Previous" can go back
+if "report_cursors" not in st.session_state:
+    st.session_state.report_cursors = [None]
+page = list(
+    sync_collection.find(page_filter(st.session_state.report_cursors[-1]), REPORT_FIELDS)
+    .sort(PAGE_SORT)
+    .limit(PAGE_SIZE + 1)
+)
+reports, has_next = page[:PAGE_SIZE], len(page) > PAGE_SIZE
+
+if not reports and len(st.session_state.report_cursors) > 1:
+    # The last report on this page was deleted
+    st.session_state.report_cursors.pop()
+    st.rerun()
+
+if reports:
+    for report in reports:
+        col1, col2, col3 = st.columns([4, 2, 2])
+
+        with col1:
+            st.write(f"📄 **{report['filename']}**")
+            st.write(f"🕒 Uploaded: {report['uploaded_at'].strftime('%Y-%m-%d %H:%M:%S')}")
+
+        with col2:
+            # A link to the streaming endpoint; the file is only read when it is actually downloaded
+            st.markdown(f"[📥 Download]({API_URL}/download-report/{report['_id']})")
+
+        with col3:
+            if st.button("🗑️ Delete", key=str(report["_id"])):
+                delete_url = f"{API_URL}/delete-report/{str(report['_id'])}"
+                response = requests.delete(delete_url)
+                if response.status_code == 200:
+                    st.success(f"Deleted {report['filename']}")
+                    st.rerun()
+                else:
+                    st.error(f"Failed to delete: {response.text}")
+
+    prev_col, page_col, next_col = st.columns([2, 4, 2])
+    with prev_col:
+        if len(st.session_state.report_cursors) > 1 and st.button("⬅️ Previous"):
+            st.session_state.report_cursors.pop()
+            st.rerun()
+    with page_col:
+        st.caption(f"Page {len(st.session_state.report_cursors)}")
+    with next_col:
+        if has_next and st.button("Next ➡️"):
+            st.session_state.report_cursors.append(encode_cursor(reports[-1]))
+            st.rerun()
+else:
+    st.info("No reports uploaded yet.")
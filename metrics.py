@@ -0,0 +1,171 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager, nullcontext
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (8, 16, 32, 64, 128, 256, 512, 1024, 2048)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Histogram:
+    """Prometheus histogram with one label; buckets are stored per bucket and summed up when rendered"""
+
+    def __init__(self, name, help_text, buckets, label):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.label = label
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = {"buckets": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            series["buckets"][bisect.bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_value, series in sorted(self._series.items()):
+                label = f'{self.label}="{label_value}"'
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), series["buckets"]):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{{{label},le="{_format_value(bound)}"}} {cumulative}')
+                lines.append(f"{self.name}_sum{{{label}}} {_format_value(series['sum'])}")
+                lines.append(f"{self.name}_count{{{label}}} {series['count']}")
+        return lines
+
+class Counter:
+    def __init__(self, name, help_text, label):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_value, amount=1):
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_value, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{{{self.label}="{label_value}"}} {value}')
+        return lines
+
+class RequestTimer:
+    """Stage durations and LLM token counts for one request, also fed into the shared histograms"""
+
+    enabled = True
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.stages = {}
+        self.tokens = {}
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()  # intent classification reports from its own thread
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(name, time.perf_counter() - start)
+
+    def record_stage(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+        self.metrics.stage_seconds.observe(name, seconds)
+
+    def record_tokens(self, stage, prompt_tokens, completion_tokens, seconds):
+        rate = completion_tokens / seconds if seconds > 0 else 0.0
+        with self._lock:
+            self.tokens[stage] = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "tokens_per_second": round(rate, 2),
+            }
+        self.metrics.tokens.observe(f"{stage}_prompt", prompt_tokens)
+        self.metrics.tokens.observe(f"{stage}_completion", completion_tokens)
+        self.metrics.tokens_per_second.observe(stage, rate)
+
+    def finish(self):
+        """Record the end-to-end time and return the per-request summary"""
+        self.record_stage("total", time.perf_counter() - self._start)
+        return self.summary()
+
+    def summary(self):
+        with self._lock:
+            return {
+                "stages_ms": {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()},
+                "tokens": dict(self.tokens),
+            }
+
+class NullTimer:
+    """Stand-in when metrics are off: every hook is a no-op and nothing is counted"""
+
+    enabled = False
+    _stage = nullcontext()
+
+    def stage(self, name):
+        return self._stage
+
+    def record_stage(self, name, seconds):
+        pass
+
+    def record_tokens(self, stage, prompt_tokens, completion_tokens, seconds):
+        pass
+
+    def finish(self):
+        return None
+
+    def summary(self):
+        return None
+
+NULL_TIMER = NullTimer()
+
+class Metrics:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stage_seconds = Histogram(
+            "medibot_stage_duration_seconds", "Time spent in each request stage", DURATION_BUCKETS, "stage")
+        self.tokens = Histogram(
+            "medibot_llm_tokens", "Prompt and completion tokens per LLM call", TOKEN_BUCKETS, "kind")
+        self.tokens_per_second = Histogram(
+            "medibot_llm_tokens_per_second", "Completion tokens generated per second", RATE_BUCKETS, "stage")
+        self.requests = Counter("medibot_chat_requests_total", "Chat requests by outcome", "outcome")
+        self.errors = Counter("medibot_errors_total", "Errors by the stage that raised them", "stage")
+        self.intents = Counter("medibot_intent_classifications_total", "Query intents by what decided them", "source")
+
+    def timer(self):
+        return RequestTimer(self) if self.enabled else NULL_TIMER
+
+    def count_request(self, outcome):
+        if self.enabled:
+            self.requests.inc(outcome)
+
+    def count_error(self, stage):
+        if self.enabled:
+            self.errors.inc(stage)
+
+    def count_intents(self, source):
+        if self.enabled:
+            self.intents.inc(source)
+
+    def render(self):
+        lines = []
+        for metric in (self.stage_seconds, self.tokens, self.tokens_per_second, self.requests, self.errors,
+                       self.intents):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,99 @@
+import os
+import time
+import hashlib
+import argparse
+
+class PrefixCachedLlama:
+    """Wraps a LangChain LlamaCpp so prompts starting with a registered prefix reuse its saved KV cache"""
+
+    def __init__(self, llm, prefixes=()):
+        self.llm = llm
+        self.client = llm.client  # the underlying llama_cpp.Llama
+        self.prefixes = list(prefixes)
+        self._states = {}
+
+    def __getattr__(self, name):
+        if name == "llm":
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+    def _key(self, prefix):
+        # A new prefix text, model file or model revision on disk all yield a new key
+        model_path = self.client.model_path
+        stat = os.stat(model_path)
+        return hashlib.sha256(f"{model_path}:{stat.st_size}:{stat.st_mtime_ns}:{prefix}".encode("utf-8")).hexdigest()
+
+    def _state_for(self, prefix):
+        key = self._key(prefix)
+        state = self._states.get(key)
+        if state is None:
+            tokens = self.client.tokenize(prefix.encode("utf-8"))
+            self.client.reset()
+            self.client.eval(tokens)
+            state = self.client.save_state()
+            # Only the current states are kept, so a changed prefix or model drops the stale ones
+            live_keys = {self._key(p) for p in self.prefixes}
+            self._states = {k: v for k, v in self._states.items() if k in live_keys}
+            self._states[key] = state
+        return state
+
+    def restore_prefix(self, prompt):
+        """Load the saved state for the prompt's prefix; llama.cpp then only evaluates the remaining tokens"""
+        for prefix in self.prefixes:
+            if prompt.startswith(prefix):
+                self.client.load_state(self._state_for(prefix))
+                return True
+        return False
+
+    def invalidate(self):
+        self._states.clear()
+
+    def __call__(self, prompt, *args, **kwargs):
+        self.restore_prefix(prompt)
+        return self.llm(prompt, *args, **kwargs)
+
+    def stream(self, prompt, *args, **kwargs):
+        self.restore_prefix(prompt)
+        yield from self.llm.stream(prompt, *args, **kwargs)
+
+def benchmark_prefill(cached_llm, prompts):
+    """Time a one-token completion per prompt from a cold context and from the restored prefix state"""
+    client = cached_llm.client
+    results = {"cold_ms": [], "cached_ms": [], "prompt_tokens": [], "prefix_tokens": []}
+    for prompt in prompts:
+        client.reset()
+        start = time.perf_counter()
+        client.create_completion(prompt, max_tokens=1)
+        results["cold_ms"].append((time.perf_counter() - start) * 1000)
+
+        cached_llm.restore_prefix(prompt)
+        prefix_tokens = client.n_tokens
+        start = time.perf_counter()
+        client.create_completion(prompt, max_tokens=1)
+        results["cached_ms"].append((time.perf_counter() - start) * 1000)
+
+        results["prompt_tokens"].append(len(client.tokenize(prompt.encode("utf-8"))))
+        results["prefix_tokens"].append(prefix_tokens)
+    return results
+
+if __name__ == "__main__":
+    from langchain_community.llms import LlamaCpp
+    from hybrid import LLM_KWARGS, INTENT_PROMPT_PREFIX, intent_prompt, WARMUP_QUERY
+
+    parser = argparse.ArgumentParser(description="Measure prefill saved by caching the intent-classification prefix")
+    parser.add_argument("--model", default=LLM_KWARGS["model_path"])
+    parser.add_argument("--queries", nargs="*", default=[
+        WARMUP_QUERY, "What is SMA?", "MRI protocol for stroke", "First-line antibiotics for pneumonia"
+    ])
+    args = parser.parse_args()
+
+    llm = PrefixCachedLlama(LlamaCpp(**{**LLM_KWARGS, "model_path": args.model, "verbose": False}), [INTENT_PROMPT_PREFIX])
+    results = benchmark_prefill(llm, [intent_prompt(query) for query in args.queries])
+
+    cold = sum(results["cold_ms"]) / len(args.queries)
+    cached = sum(results["cached_ms"]) / len(args.queries)
+    print(f"Prompt tokens per call: {sum(results['prompt_tokens']) / len(args.queries):.0f} "
+          f"(prefix: {results['prefix_tokens'][0]})")
+    print(f"Cold prefill:   {cold:.1f} ms/call")
+    print(f"Cached prefill: {cached:.1f} ms/call")
+    print(f"Saved:          {cold - cached:.1f} ms/call ({(1 - cached / cold) * 100:.0f}%)")
@@ -0,0 +1,260 @@
+import os
+import time
+import uuid
+import argparse
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from qdrant_client import QdrantClient, models
+from chunking import (
+    iter_file_chunks, list_pdfs, embed_texts, classify_pool, classify_parallel, text_hash, _chunk_page,
+    _report_throughput, DEFAULT_DATA_DIR, EMBED_BATCH_SIZE, CLASSIFY_WORKERS, LOAD_WORKERS
+)
+from dedup import NearDuplicateIndex
+from collection_version import bump_version
+from hybrid import QDRANT_URL, COLLECTION_NAME, MEDICAL_INTENTS
+
+UPSERT_BATCH_SIZE = 256  # points per upsert request
+UPSERT_WORKERS = 4
+CLASSIFY_MODES = ["inline", "off"]
+QUANTIZATION_QUANTILE = 0.99  # clip int8 ranges to this quantile so outliers don't flatten the rest
+PAYLOAD_INDEXES = ["intents", "source", "origin"]
+
+def point_id(relative_path, text, occurrence):
+    # Same file, same chunk text, same position among repeats -> same ID, so re-running overwrites instead of duplicating
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"medibot:{relative_path}:{text_hash(text)}:{occurrence}"))
+
+def quantization_config():
+    return models.ScalarQuantization(
+        scalar=models.ScalarQuantizationConfig(
+            type=models.ScalarType.INT8,
+            quantile=QUANTIZATION_QUANTILE,
+            always_ram=True  # int8 copies stay in RAM for the first pass; originals on disk are used to rescore
+        )
+    )
+
+def ensure_collection(client, collection, dimension, quantize=False, on_disk=False, recreate=False):
+    if recreate and client.collection_exists(collection):
+        client.delete_collection(collection)
+
+    if not client.collection_exists(collection):
+        client.create_collection(
+            collection_name=collection,
+            vectors_config=models.VectorParams(size=dimension, distance=models.Distance.COSINE, on_disk=on_disk),
+            quantization_config=quantization_config() if quantize else None
+        )
+    elif quantize or on_disk:
+        # Applied to an existing collection; Qdrant rebuilds the affected segments in the background
+        client.update_collection(
+            collection_name=collection,
+            vectors_config={"": models.VectorParamsDiff(on_disk=True)} if on_disk else None,
+            quantization_config=quantization_config() if quantize else None
+        )
+
+    payload_schema = client.get_collection(collection).payload_schema or {}
+    for field in PAYLOAD_INDEXES:
+        if field not in payload_schema:
+            client.create_payload_index(collection, field_name=field, field_schema=models.PayloadSchemaType.KEYWORD)
+
+def origin_of(directory_path):
+    # Absolute, so runs from different working directories agree on which directory a point came from
+    return os.path.normpath(os.path.abspath(directory_path))
+
+def file_points(directory_path, path, chunks):
+    relative_path = os.path.relpath(path, directory_path).replace(os.sep, "/")
+    origin = origin_of(directory_path)
+    seen = Counter()
+    points = []
+    for chunk in chunks:
+        text = chunk.page_content.strip()
+        if not text:
+            continue
+        seen[text] += 1
+        points.append({
+            "id": point_id(relative_path, text, seen[text]),
+            "text": text,
+            "source": path,
+            "origin": origin,
+            "page": _chunk_page(chunk),
+        })
+    return points
+
+def dedup_points(points, dedup_index, copies):
+    """Drop points that repeat the text of a kept point; copies maps each kept ID to its source, then the others"""
+    kept_points = []
+    for point in points:
+        kept = dedup_index.check(point["id"], point["text"])
+        if kept is None:
+            kept_points.append(point)
+            copies[point["id"]] = [point["source"]]
+        elif point["source"] not in copies[kept]:
+            copies[kept].append(point["source"])
+    return kept_points
+
+def record_duplicate_sources(client, collection, sources, copies):
+    """Set duplicate_sources on kept points of the ingested files, and clear lists that no longer apply"""
+    with_copies = {point_id: files[1:] for point_id, files in copies.items() if len(files) > 1}
+    client.set_payload(
+        collection_name=collection,
+        payload={"duplicate_sources": []},
+        points=models.Filter(
+            must=[models.FieldCondition(key="source", match=models.MatchAny(any=sources))],
+            must_not=[models.IsEmptyCondition(is_empty=models.PayloadField(key="duplicate_sources"))]
+            + ([models.HasIdCondition(has_id=list(with_copies))] if with_copies else [])
+        )
+    )
+    by_sources = defaultdict(list)
+    for point_id, files in with_copies.items():
+        by_sources[tuple(files)].append(point_id)
+    for files, point_ids in by_sources.items():
+        client.set_payload(collection_name=collection, payload={"duplicate_sources": list(files)}, points=point_ids)
+
+def remove_stale_points(client, collection, source, keep_ids):
+    """Delete points of a re-ingested file whose chunk no longer exists"""
+    client.delete(
+        collection_name=collection,
+        points_selector=models.FilterSelector(filter=models.Filter(
+            must=[models.FieldCondition(key="source", match=models.MatchValue(value=source))],
+            must_not=[models.HasIdCondition(has_id=keep_ids)] if keep_ids else None
+        ))
+    )
+
+def prune_missing_sources(client, collection, directory_path, sources):
+    """Delete points that came from the ingested directory but whose source file is no longer in it
+
+    Only points with this directory as their origin are considered, so uploaded reports and other ingested
+    directories are left alone. Points of the current files are stamped first, which also covers points
+    upserted before origins were recorded.
+    """
+    origin = origin_of(directory_path)
+    client.set_payload(
+        collection_name=collection,
+        payload={"origin": origin},
+        points=models.Filter(must=[models.FieldCondition(key="source", match=models.MatchAny(any=sources))])
+    )
+    client.delete(
+        collection_name=collection,
+        points_selector=models.FilterSelector(filter=models.Filter(
+            must=[models.FieldCondition(key="origin", match=models.MatchValue(value=origin))],
+            must_not=[models.FieldCondition(key="source", match=models.MatchAny(any=sources))]
+        ))
+    )
+
+def upsert_points(client, collection, points, vectors, intents):
+    client.upsert(
+        collection_name=collection,
+        points=[
+            models.PointStruct(
+                id=point["id"],
+                vector=vector.tolist(),
+                payload={"text": point["text"], "source": point["source"], "origin": point["origin"],
+                         "page": point["page"], "intents": labels}
+            )
+            for point, vector, labels in zip(points, vectors, intents)
+        ],
+        wait=True
+    )
+    return len(points)
+
+def ingest_directory(directory_path, client, collection=COLLECTION_NAME, batch_size=EMBED_BATCH_SIZE,
+                     upsert_batch_size=UPSERT_BATCH_SIZE, upsert_workers=UPSERT_WORKERS, classify="inline",
+                     workers=CLASSIFY_WORKERS, load_workers=LOAD_WORKERS, force=False, prune=False, dedup=True):
+    if not os.path.exists(directory_path):
+        print("⚠️ Directory not found:", directory_path)
+        return
+
+    start = time.perf_counter()
+    paths = list_pdfs(directory_path)
+    stats = Counter()
+    in_flight = set()
+    dedup_index = NearDuplicateIndex() if dedup else None
+    copies = {}
+
+    def drain(limit):
+        # Keep at most `limit` upserts in flight so embedded batches never pile up in memory
+        nonlocal in_flight
+        while len(in_flight) > limit:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                stats["upserted"] += future.result()
+
+    with ThreadPoolExecutor(max_workers=upsert_workers, thread_name_prefix="upsert") as upserter, \
+            classify_pool(workers if classify == "inline" else 1) as pool:
+
+        def submit(points):
+            if not force:
+                # Deterministic IDs: a point that already exists holds exactly this chunk's text
+                existing = {str(p.id) for p in client.retrieve(collection, ids=[p["id"] for p in points],
+                                                               with_payload=False, with_vectors=False)}
+                stats["skipped"] += len(existing)
+                points = [p for p in points if p["id"] not in existing]
+            if not points:
+                return
+            texts = [p["text"] for p in points]
+            vectors = embed_texts(texts, batch_size)
+            intents = (classify_parallel(texts, "chunk", workers, pool=pool, intents=MEDICAL_INTENTS)
+                       if classify == "inline" else [[] for _ in points])
+            drain(upsert_workers * 2 - 1)
+            in_flight.add(upserter.submit(upsert_points, client, collection, points, vectors, intents))
+
+        batch = []
+        keep_ids = {}
+        for path, chunks in iter_file_chunks(paths, load_workers):
+            points = file_points(directory_path, path, chunks)
+            stats["files"] += 1
+            stats["chunks"] += len(points)
+            if dedup_index is not None:
+                points = dedup_points(points, dedup_index, copies)
+            keep_ids[path] = [p["id"] for p in points]
+            for point in points:
+                batch.append(point)
+                if len(batch) == upsert_batch_size:
+                    submit(batch)
+                    batch = []
+        if batch:
+            submit(batch)
+        drain(0)
+
+    # Only once every kept point is stored, so a chunk that moved to another file's copy never goes missing.
+    # This also removes points of a file that are now dropped as a duplicate of another file's
+    for path, ids in keep_ids.items():
+        remove_stale_points(client, collection, path, ids)
+
+    if prune and paths:
+        prune_missing_sources(client, collection, directory_path, paths)
+    if dedup_index is not None and paths:
+        record_duplicate_sources(client, collection, paths, copies)
+    bump_version(client, collection)  # drops answers the chat server cached from the old points
+
+    _report_throughput("Upserted", stats["upserted"], start)
+    print(f"✔️ {stats['files']} files, {stats['chunks']} chunks: {stats['upserted']} upserted, "
+          f"{stats['skipped']} already in '{collection}'.")
+    if dedup_index is not None:
+        dedup_index.report()
+        stats.update({f"dedup_{key}": value for key, value in dedup_index.stats.items()})
+    return dict(stats)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chunk, embed, classify and upsert a directory of medical PDFs into Qdrant")
+    parser.add_argument("directory", nargs="?", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--url", default=QDRANT_URL)
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="Chunks per embedding batch")
+    parser.add_argument("--upsert-batch-size", type=int, default=UPSERT_BATCH_SIZE, help="Points per upsert request")
+    parser.add_argument("--upsert-workers", type=int, default=UPSERT_WORKERS, help="Concurrent upsert requests")
+    parser.add_argument("--classify", choices=CLASSIFY_MODES, default="inline", help="Attach intent payloads or skip them")
+    parser.add_argument("--workers", type=int, default=CLASSIFY_WORKERS, help="Processes used for intent classification")
+    parser.add_argument("--load-workers", type=int, default=LOAD_WORKERS, help="Processes used for PDF parsing")
+    parser.add_argument("--quantize", action="store_true", help="Scalar int8 quantization (about 4x less vector RAM)")
+    parser.add_argument("--on-disk", action="store_true", help="Keep original float32 vectors on disk")
+    parser.add_argument("--recreate", action="store_true", help="Drop and recreate the collection first")
+    parser.add_argument("--force", action="store_true", help="Re-embed and upsert chunks that already exist")
+    parser.add_argument("--prune", action="store_true", help="Delete points of this directory's PDFs that are no longer in it")
+    parser.add_argument("--no-dedup", action="store_true", help="Upsert exact and near-duplicate chunks too")
+    args = parser.parse_args()
+
+    client = QdrantClient(args.url)
+    dimension = embed_texts(["dimension probe"]).shape[1]
+    ensure_collection(client, args.collection, dimension, args.quantize, args.on_disk, args.recreate)
+    ingest_directory(args.directory, client, args.collection, args.batch_size, args.upsert_batch_size,
+                     args.upsert_workers, args.classify, args.workers, args.load_workers, args.force, args.prune,
+                     not args.no_dedup)
@@ -0,0 +1,283 @@
+import heapq
+import argparse
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+import pymongo
+from pymongo import ReturnDocument
+
+MONGO_URI = "mongodb://localhost:27017"
+HEAP_SIZE = 1000  # upcoming reminders kept in memory
+SYNC_INTERVAL = 5.0  # seconds between checks for new or edited reminders
+SYNC_OVERLAP = timedelta(seconds=2)  # re-read this much of the previous sync, for writes that raced it
+NOTIFY_WORKERS = 4
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF = 60  # seconds before a failed notification is retried, doubled on every further attempt
+
+# Due-time order (with _id to break ties) for the heap refills, and change order for the sync
+REMINDER_INDEXES = [
+    pymongo.IndexModel([("status", pymongo.ASCENDING), ("due_at", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)]),
+    pymongo.IndexModel([("updated_at", pymongo.ASCENDING)]),
+]
+
+def utcnow():
+    # Naive UTC, which is what pymongo stores and returns
+    return datetime.utcnow()
+
+def to_utc(local_date, local_time):
+    """A date and time entered in the server's local timezone, as naive UTC"""
+    return datetime.combine(local_date, local_time).astimezone(timezone.utc).replace(tzinfo=None)
+
+def to_local(utc_datetime):
+    return utc_datetime.replace(tzinfo=timezone.utc).astimezone()
+
+def new_reminder(title, notes, due_at):
+    now = utcnow()
+    return {
+        "title": title,
+        "notes": notes,
+        "due_at": due_at,
+        "status": "pending",
+        "attempts": 0,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+def migrate_legacy_reminders(collection):
+    """Give reminders saved with separate date and time strings a due_at and a status"""
+    migrated = 0
+    for reminder in collection.find({"status": {"$exists": False}}, {"date": 1, "time": 1}):
+        try:
+            due = datetime.strptime(f"{reminder['date']} {reminder.get('time', '09:00')}", "%Y-%m-%d %H:%M")
+        except (KeyError, ValueError):
+            continue
+        due_at = to_utc(due.date(), due.time())
+        collection.update_one({"_id": reminder["_id"]}, {"$set": {
+            "due_at": due_at,
+            "status": "pending" if due_at > utcnow() else "expired",
+            "attempts": 0,
+            "updated_at": utcnow(),
+        }})
+        migrated += 1
+    return migrated
+
+class Notifier(ABC):
+    """Delivers a due reminder; raise to have it retried"""
+
+    @abstractmethod
+    def send(self, reminder):
+        ...
+
+class ConsoleNotifier(Notifier):
+    def send(self, reminder):
+        print(f"⏰ {to_local(reminder['due_at']):%Y-%m-%d %H:%M} {reminder['title']}"
+              + (f" - {reminder['notes']}" if reminder.get("notes") else ""))
+
+class WebhookNotifier(Notifier):
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, reminder):
+        import requests
+        response = requests.post(self.url, timeout=self.timeout, json={
+            "id": str(reminder["_id"]),
+            "title": reminder["title"],
+            "notes": reminder.get("notes"),
+            "due_at": reminder["due_at"].isoformat() + "Z",
+        })
+        response.raise_for_status()
+
+class LocalNotifier(Notifier):
+    """Keeps delivered reminders in memory; a stand-in for tests and local runs"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send(self, reminder):
+        if self.fail:
+            raise RuntimeError("LocalNotifier set to fail")
+        with self._lock:
+            self.sent.append(reminder)
+
+class ReminderScheduler:
+    """Fires due reminders from an in-memory min-heap of the next HEAP_SIZE, refilled by indexed range queries
+
+    The loop sleeps until the earliest due time or the next sync, whichever comes first, so waking up costs
+    the same with a thousand reminders or a million. Mongo is only read in index order: refills continue
+    after the last loaded (due_at, _id), and syncs read reminders changed since the last sync.
+    """
+
+    def __init__(self, collection, notifier, capacity=HEAP_SIZE, sync_interval=SYNC_INTERVAL,
+                 notify_workers=NOTIFY_WORKERS):
+        self.collection = collection
+        self.notifier = notifier
+        self.capacity = capacity
+        self.sync_interval = sync_interval
+        self.heap = []  # (due_at, _id)
+        self._queued = {}  # _id -> due_at of entries in the heap, to skip re-reads
+        self._cursor = None  # (due_at, _id) of the last reminder loaded by a refill
+        self._exhausted = False  # the last refill reached the end, so the heap holds every pending reminder
+        self._last_sync = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._senders = ThreadPoolExecutor(max_workers=notify_workers, thread_name_prefix="notify")
+        self.fired = 0
+        self.failed = 0
+
+    def _push(self, due_at, reminder_id):
+        if self._queued.get(reminder_id) == due_at:
+            return
+        self._queued[reminder_id] = due_at
+        heapq.heappush(self.heap, (due_at, reminder_id))
+
+    def _pop(self):
+        due_at, reminder_id = heapq.heappop(self.heap)
+        if self._queued.get(reminder_id) == due_at:
+            del self._queued[reminder_id]
+        return due_at, reminder_id
+
+    def refill(self):
+        wanted = self.capacity - len(self.heap)
+        if wanted <= 0 or self._exhausted:
+            return
+        query = {"status": "pending"}
+        if self._cursor is not None:
+            due_at, reminder_id = self._cursor
+            query["$or"] = [{"due_at": {"$gt": due_at}}, {"due_at": due_at, "_id": {"$gt": reminder_id}}]
+        loaded = 0
+        for reminder in self.collection.find(query, {"due_at": 1}).sort(
+                [("due_at", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)]).limit(wanted):
+            self._push(reminder["due_at"], reminder["_id"])
+            self._cursor = (reminder["due_at"], reminder["_id"])
+            loaded += 1
+        self._exhausted = loaded < wanted
+
+    def sync(self):
+        """Pick up reminders created or rescheduled since the last sync that belong in the heap"""
+        now = utcnow()
+        if self._last_sync is None:
+            self._last_sync = now  # everything older is reached by refills
+            return
+        query = {"status": "pending", "updated_at": {"$gte": self._last_sync - SYNC_OVERLAP}}
+        self._last_sync = now
+        for reminder in self.collection.find(query, {"due_at": 1}).sort("updated_at", pymongo.ASCENDING):
+            key = (reminder["due_at"], reminder["_id"])
+            # Later ones are reached by a refill; once refills are exhausted every pending reminder is held here
+            if self._exhausted or self._cursor is None or key <= self._cursor:
+                self._push(*key)
+                if self._exhausted and (self._cursor is None or key > self._cursor):
+                    self._cursor = key
+        if len(self.heap) > 2 * self.capacity:
+            self._trim()
+
+    def _trim(self):
+        # Keep the earliest `capacity`; the rest are read again by later refills
+        self.heap = heapq.nsmallest(self.capacity, self.heap)
+        heapq.heapify(self.heap)
+        self._queued = {reminder_id: due_at for due_at, reminder_id in self.heap}
+        self._cursor = max(self.heap)
+        self._exhausted = False
+
+    def fire(self, due_at, reminder_id):
+        # Claimed only if unchanged since it was queued: deleted or rescheduled reminders drop out here
+        reminder = self.collection.find_one_and_update(
+            {"_id": reminder_id, "status": "pending", "due_at": due_at},
+            {"$set": {"status": "sending", "updated_at": utcnow()}, "$inc": {"attempts": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if reminder is not None:
+            self._senders.submit(self._deliver, reminder)
+
+    def _deliver(self, reminder):
+        try:
+            self.notifier.send(reminder)
+        except Exception as e:
+            print(f"⚠️ Reminder {reminder['_id']} failed on attempt {reminder['attempts']}: {e}")
+            self.failed += 1
+            now = utcnow()
+            if reminder["attempts"] >= MAX_ATTEMPTS:
+                update = {"status": "failed", "last_error": str(e), "updated_at": now}
+            else:
+                # Rescheduled as pending, so the next sync queues it again
+                retry_at = now + timedelta(seconds=RETRY_BACKOFF * 2 ** (reminder["attempts"] - 1))
+                update = {"status": "pending", "due_at": retry_at, "last_error": str(e), "updated_at": now}
+            self.collection.update_one({"_id": reminder["_id"]}, {"$set": update})
+            return
+        self.fired += 1
+        self.collection.update_one({"_id": reminder["_id"]}, {"$set": {"status": "sent", "sent_at": utcnow(),
+                                                                      "updated_at": utcnow()}})
+
+    def recover(self):
+        """Requeue reminders left mid-delivery by a previous run"""
+        self.collection.update_many({"status": "sending"}, {"$set": {"status": "pending", "updated_at": utcnow()}})
+
+    def run_once(self):
+        """Fire everything due, sync and refill if needed; returns seconds until there is more to do"""
+        now = utcnow()
+        if self._last_sync is None or (now - self._last_sync).total_seconds() >= self.sync_interval:
+            self.sync()
+        if len(self.heap) < self.capacity // 2:
+            self.refill()
+        while self.heap and self.heap[0][0] <= now:
+            self.fire(*self._pop())
+            if not self.heap:
+                self.refill()
+        until_sync = self.sync_interval - (utcnow() - self._last_sync).total_seconds()
+        if not self.heap:
+            return max(0.0, until_sync)
+        return max(0.0, min(until_sync, (self.heap[0][0] - utcnow()).total_seconds()))
+
+    def run(self):
+        self.recover()
+        self.sync()
+        self.refill()
+        try:
+            while not self._stop.is_set():
+                timeout = self.run_once()
+                self._wake.wait(timeout)
+                self._wake.clear()
+        finally:
+            self._senders.shutdown(wait=True)
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def stats(self):
+        return {
+            "queued": len(self.heap),
+            "next_due": self.heap[0][0].isoformat() if self.heap else None,
+            "fired": self.fired,
+            "failed": self.failed,
+        }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send reminders when they fall due")
+    parser.add_argument("--mongo", default=MONGO_URI)
+    parser.add_argument("--notifier", choices=["console", "webhook"], default="console")
+    parser.add_argument("--webhook-url", help="Endpoint that receives due reminders as JSON")
+    parser.add_argument("--heap-size", type=int, default=HEAP_SIZE, help="Upcoming reminders kept in memory")
+    args = parser.parse_args()
+
+    if args.notifier == "webhook" and not args.webhook_url:
+        parser.error("--webhook-url is required with --notifier webhook")
+    notifier = WebhookNotifier(args.webhook_url) if args.notifier == "webhook" else ConsoleNotifier()
+
+    reminder_collection = pymongo.MongoClient(args.mongo)["healthapp"]["reminders"]
+    reminder_collection.create_indexes(REMINDER_INDEXES)
+    migrated = migrate_legacy_reminders(reminder_collection)
+    if migrated:
+        print(f"Migrated {migrated} reminders to UTC due times")
+
+    scheduler = ReminderScheduler(reminder_collection, notifier, args.heap_size)
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        scheduler.stop()
@@ -0,0 +1,101 @@
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+_UNCHECKED = object()
+
+class SemanticCache:
+    """Answer cache keyed by query embedding; a hit is a cached query above a cosine-similarity threshold"""
+
+    def __init__(self, threshold=0.95, max_entries=1024, ttl=3600):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # Unit vectors in a fixed-size matrix; at this size a flat inner-product scan takes microseconds
+        self._vectors = None
+        self._live = np.zeros(max_entries, dtype=bool)
+        self._values = [None] * max_entries
+        self._expires = np.zeros(max_entries, dtype=np.float64)
+        self._lru = OrderedDict()
+        self._version = _UNCHECKED
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, vector):
+        query = self._normalize(vector)
+        with self._lock:
+            if self._vectors is None or not self._live.any():
+                self.misses += 1
+                return None
+            now = time.monotonic()
+            expired = self._live & (self._expires <= now)
+            for slot in np.flatnonzero(expired):
+                self._drop(slot)
+
+            scores = self._vectors @ query
+            scores[~self._live] = -1.0
+            slot = int(np.argmax(scores))
+            if scores[slot] < self.threshold:
+                self.misses += 1
+                return None
+            self._lru.move_to_end(slot)
+            self.hits += 1
+            return self._values[slot]
+
+    def put(self, vector, value):
+        entry = self._normalize(vector)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, entry.shape[0]), dtype=np.float32)
+            free = np.flatnonzero(~self._live)
+            if len(free):
+                slot = int(free[0])
+            else:
+                slot, _ = self._lru.popitem(last=False)
+                self.evictions += 1
+            self._vectors[slot] = entry
+            self._values[slot] = value
+            self._expires[slot] = time.monotonic() + self.ttl
+            self._live[slot] = True
+            self._lru[slot] = None
+
+    def _drop(self, slot):
+        self._live[slot] = False
+        self._values[slot] = None
+        self._lru.pop(slot, None)
+
+    def invalidate(self):
+        with self._lock:
+            self._live[:] = False
+            self._values = [None] * self.max_entries
+            self._lru.clear()
+            self.invalidations += 1
+
+    def check_version(self, version):
+        """Clear the cache when the collection's version marker has changed since the last check"""
+        if self._version is not _UNCHECKED and version != self._version:
+            self.invalidate()
+        self._version = version
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": int(self._live.sum()),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
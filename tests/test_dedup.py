@@ -0,0 +1,36 @@
+from dedup import NearDuplicateIndex
+
+ORIGINAL = ("Patients with stage 2 hypertension should take 5 mg of amlodipine daily and monitor their blood "
+            "pressure at home every week for at least three months before the next review.")
+EDITED = ORIGINAL.replace("should take", "should not take")
+
+def test_exact_and_near_duplicates_are_matched():
+    index = NearDuplicateIndex()
+    assert index.check(0, ORIGINAL) is None
+    assert index.check(1, "  " + ORIGINAL.upper()) == 0
+    assert index.check(2, EDITED) == 0
+    assert index.stats["exact"] == 1 and index.stats["near"] == 1
+
+def test_different_numbers_are_kept():
+    index = NearDuplicateIndex()
+    index.check(0, ORIGINAL)
+    assert index.check(1, ORIGINAL.replace("5 mg", "50 mg")) is None
+
+def test_excluded_chunks_are_not_matched():
+    # An edited chunk of a file being re-indexed must not match the version it replaces
+    index = NearDuplicateIndex()
+    index.check(0, ORIGINAL)
+    assert index.check(1, EDITED, exclude={0}) is None
+    assert index.check(2, ORIGINAL, exclude={0}) == 1
+    index.remove([0])
+    assert index.check(3, EDITED) == 1
+    assert index.stats["exact"] == 1
+
+def test_save_and_load_round_trip(tmp_path):
+    index = NearDuplicateIndex()
+    index.check(0, ORIGINAL)
+    path = str(tmp_path / "dedup.npz")
+    index.save(path)
+    loaded = NearDuplicateIndex.load(path)
+    assert len(loaded) == 1
+    assert loaded.check(1, EDITED) == 0
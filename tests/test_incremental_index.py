@@ -0,0 +1,80 @@
+import json
+import hashlib
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("whoosh")
+pytest.importorskip("langchain_community")
+
+import chunking
+from chunk_store import ChunkStore
+
+CHUNKS = [
+    "Patients with stage 2 hypertension should take 5 mg of amlodipine daily and monitor their blood "
+    "pressure at home every week for at least three months before the next review.",
+    "Type 2 diabetes is managed with diet, exercise and metformin, with HbA1c checked every 3 months.",
+]
+
+class Chunk:
+    def __init__(self, text, source, page):
+        self.page_content = text
+        self.metadata = {"source": source, "page": page}
+
+def fake_iter_file_chunks(paths, workers=None):
+    # One chunk per paragraph, parsed in-process instead of by unstructured in a process pool
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            yield path, [Chunk(text, path, page) for page, text in enumerate(f.read().split("\n\n"))]
+
+def fake_embed_texts(texts, batch_size=None):
+    return np.stack([np.frombuffer(hashlib.sha256(text.encode("utf-8")).digest(), dtype=np.uint8)[:8]
+                     .astype(np.float32) for text in texts])
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # every index path is relative
+    monkeypatch.setattr(chunking, "iter_file_chunks", fake_iter_file_chunks)
+    monkeypatch.setattr(chunking, "embed_texts", fake_embed_texts)
+    os.mkdir("data")
+    path = os.path.normpath("data/guide.pdf")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(CHUNKS))
+    chunking.update_index("data", classify="off", load_workers=1)
+    return path
+
+def stored_texts():
+    store = ChunkStore()
+    try:
+        return {store.text(int(chunk_id)) for chunk_id in store.ids()}
+    finally:
+        store.close()
+
+def test_edited_chunk_replaces_its_previous_version(corpus):
+    edited = CHUNKS[0].replace("should take", "should not take")
+    with open(corpus, "w", encoding="utf-8") as f:
+        f.write("\n\n".join([edited, CHUNKS[1]]))
+    chunking.update_index("data", classify="off", load_workers=1)
+
+    assert stored_texts() == {edited, CHUNKS[1]}
+    with open(chunking.MANIFEST_PATH, encoding="utf-8") as f:
+        manifest = json.load(f)
+    assert manifest["duplicates"] == {}
+    assert len(manifest["files"][corpus]["chunks"]) == 2
+
+def test_unchanged_files_are_not_rehashed(corpus, monkeypatch):
+    hashed = []
+    file_hash = chunking.file_hash
+    monkeypatch.setattr(chunking, "file_hash", lambda path: hashed.append(path) or file_hash(path))
+    chunking.update_index("data", classify="off", load_workers=1)
+    assert hashed == []
+
+    # Touched, same content: hashed once, then skipped again
+    mtime = os.stat(corpus).st_mtime_ns
+    os.utime(corpus, ns=(mtime, mtime + 10 ** 9))
+    chunking.update_index("data", classify="off", load_workers=1)
+    chunking.update_index("data", classify="off", load_workers=1)
+    assert hashed == [corpus]
+    assert stored_texts() == set(CHUNKS)
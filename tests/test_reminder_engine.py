@@ -0,0 +1,182 @@
+import copy
+import itertools
+import threading
+from datetime import timedelta
+
+import pytest
+
+pytest.importorskip("pymongo")
+
+from reminder_engine import (
+    HEAP_SIZE, MAX_ATTEMPTS, RETRY_BACKOFF, LocalNotifier, Notifier, ReminderScheduler, new_reminder, utcnow
+)
+
+class FakeCursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def sort(self, key_or_list, direction=1):
+        keys = [(key_or_list, direction)] if isinstance(key_or_list, str) else key_or_list
+        for key, direction in reversed(keys):
+            self._docs.sort(key=lambda doc: doc[key], reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self._docs = self._docs[:count]
+        return self
+
+    def __iter__(self):
+        return iter(self._docs)
+
+class FakeCollection:
+    """The subset of a pymongo collection the scheduler uses, over a dict of documents"""
+
+    def __init__(self):
+        self.docs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()  # deliveries update documents from the sender threads
+
+    def insert_one(self, doc):
+        with self._lock:
+            doc = dict(doc, _id=next(self._ids))
+            self.docs[doc["_id"]] = doc
+            return doc["_id"]
+
+    @staticmethod
+    def _matches(doc, query):
+        for key, condition in query.items():
+            if key == "$or":
+                if not any(FakeCollection._matches(doc, branch) for branch in condition):
+                    return False
+            elif isinstance(condition, dict):
+                value = doc.get(key)
+                for op, operand in condition.items():
+                    if op == "$gt" and not value > operand or op == "$gte" and not value >= operand:
+                        return False
+            elif doc.get(key) != condition:
+                return False
+        return True
+
+    @staticmethod
+    def _apply(doc, update):
+        doc.update(update.get("$set", {}))
+        for key, amount in update.get("$inc", {}).items():
+            doc[key] = doc.get(key, 0) + amount
+
+    def find(self, query, projection=None):
+        with self._lock:
+            return FakeCursor([copy.deepcopy(doc) for doc in self.docs.values() if self._matches(doc, query)])
+
+    def find_one_and_update(self, query, update, return_document=None):
+        with self._lock:
+            for doc in self.docs.values():
+                if self._matches(doc, query):
+                    self._apply(doc, update)
+                    return copy.deepcopy(doc)
+        return None
+
+    def update_one(self, query, update):
+        with self._lock:
+            for doc in self.docs.values():
+                if self._matches(doc, query):
+                    self._apply(doc, update)
+                    return
+
+    def update_many(self, query, update):
+        with self._lock:
+            for doc in self.docs.values():
+                if self._matches(doc, query):
+                    self._apply(doc, update)
+
+def add(collection, due_in, title="Take medication"):
+    return collection.insert_one(new_reminder(title, None, utcnow() + timedelta(seconds=due_in)))
+
+def run(scheduler):
+    """One scheduler pass, then wait for its deliveries (the sender pool has a single thread)"""
+    scheduler.run_once()
+    scheduler._senders.submit(lambda: None).result()
+
+def make_scheduler(collection, notifier, capacity=HEAP_SIZE):
+    scheduler = ReminderScheduler(collection, notifier, capacity, sync_interval=0, notify_workers=1)
+    scheduler.sync()
+    scheduler.refill()
+    return scheduler
+
+def test_notifier_is_abstract():
+    with pytest.raises(TypeError):
+        Notifier()
+
+def test_due_reminder_fires_once():
+    collection, notifier = FakeCollection(), LocalNotifier()
+    due = add(collection, -1)
+    later = add(collection, 3600)
+    scheduler = make_scheduler(collection, notifier)
+    for _ in range(3):
+        run(scheduler)
+    assert [reminder["_id"] for reminder in notifier.sent] == [due]
+    assert collection.docs[due]["status"] == "sent"
+    assert collection.docs[due]["attempts"] == 1
+    assert collection.docs[later]["status"] == "pending"
+    assert scheduler.stats()["fired"] == 1
+
+def test_refill_past_heap_size():
+    collection, notifier = FakeCollection(), LocalNotifier()
+    due = [add(collection, -60 + i * 0.001) for i in range(HEAP_SIZE + 5)]
+    scheduler = make_scheduler(collection, notifier)
+    assert len(scheduler.heap) == HEAP_SIZE
+    run(scheduler)
+    assert sorted(reminder["_id"] for reminder in notifier.sent) == due
+    assert all(doc["status"] == "sent" for doc in collection.docs.values())
+
+def test_sync_picks_up_late_inserts():
+    collection, notifier = FakeCollection(), LocalNotifier()
+    far = [add(collection, 3600 + i) for i in range(5)]
+    # Two schedulers: one whose heap holds every reminder, one still waiting for refills past its cursor
+    exhausted = make_scheduler(collection, notifier)
+    partial = make_scheduler(collection, notifier, capacity=2)
+    assert exhausted._exhausted and not partial._exhausted
+
+    late = add(collection, -1, "Added after startup")
+    run(exhausted)
+    assert [reminder["_id"] for reminder in notifier.sent] == [late]
+
+    collection.docs[late].update(status="pending", attempts=0, updated_at=utcnow())
+    run(partial)
+    assert [reminder["_id"] for reminder in notifier.sent] == [late, late]
+    assert all(collection.docs[reminder_id]["status"] == "pending" for reminder_id in far)
+
+def test_failed_delivery_retries_with_backoff():
+    collection, notifier = FakeCollection(), LocalNotifier(fail=True)
+    reminder_id = add(collection, -1)
+    scheduler = make_scheduler(collection, notifier)
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        failed_at = utcnow()
+        run(scheduler)
+        doc = collection.docs[reminder_id]
+        assert doc["attempts"] == attempt
+        if attempt == MAX_ATTEMPTS:
+            break
+        assert doc["status"] == "pending"
+        backoff = (doc["due_at"] - failed_at).total_seconds()
+        assert RETRY_BACKOFF * 2 ** (attempt - 1) <= backoff < RETRY_BACKOFF * 2 ** (attempt - 1) + 5
+        # Nothing fires before the retry time
+        run(scheduler)
+        assert collection.docs[reminder_id]["attempts"] == attempt
+        # Let the backoff elapse
+        doc.update(due_at=utcnow() - timedelta(seconds=1), updated_at=utcnow())
+    assert collection.docs[reminder_id]["status"] == "failed"
+    assert "LocalNotifier set to fail" in collection.docs[reminder_id]["last_error"]
+    assert scheduler.stats()["failed"] == MAX_ATTEMPTS
+    assert notifier.sent == []
+
+def test_recover_requeues_interrupted_deliveries():
+    collection, notifier = FakeCollection(), LocalNotifier()
+    reminder_id = add(collection, -1)
+    collection.docs[reminder_id]["status"] = "sending"
+    scheduler = ReminderScheduler(collection, notifier, sync_interval=0, notify_workers=1)
+    scheduler.recover()
+    scheduler.sync()
+    scheduler.refill()
+    run(scheduler)
+    assert [reminder["_id"] for reminder in notifier.sent] == [reminder_id]
+    assert collection.docs[reminder_id]["status"] == "sent"